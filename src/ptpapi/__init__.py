@@ -1,6 +1,7 @@
 # flake8: noqa
 """Exists solely to make 'import ptpapi' possible"""
 from ptpapi.api import API
+from ptpapi.filelist import Filelist
 from ptpapi.movie import Movie
 from ptpapi.torrent import Torrent
 from ptpapi.user import User
@@ -23,6 +23,7 @@ retry=False
 [Reseed]
 action=hard
 findBy=filename,title
+sizeTolerance=10
 """
 
 env_prefix = "PTPAPI_"
@@ -40,6 +41,7 @@ env_keys = {
     "RESEED_ACTION": ("Reseed", "action"),
     "RESEED_FINDBY": ("Reseed", "findBy"),
     "RESEED_CLIENT": ("Reseed", "client"),
+    "RESEED_SIZE_TOLERANCE": ("Reseed", "sizeTolerance"),
     "PROWLARR_API_KEY": ("Prowlarr", "api_key"),
     "PROWLARR_URL": ("Prowlarr", "url"),
 }
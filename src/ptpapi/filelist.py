@@ -0,0 +1,129 @@
+"""A compact representation of a torrent's file list"""
+import os.path
+import sys
+
+from array import array
+from collections.abc import ItemsView, Mapping
+
+
+class Filelist(Mapping):
+    """A read-only mapping of file paths to integer sizes
+
+    Directories are stored once and shared between all the files inside
+    them, and the base names and sizes are packed together, which keeps
+    large (e.g. Blu-ray folder) file lists small in memory."""
+
+    __slots__ = (
+        "_dirs",
+        "_dir_ids",
+        "_file_dirs",
+        "_names",
+        "_name_ends",
+        "_sizes",
+        "_by_name",
+        "_by_size",
+    )
+
+    def __init__(self, files=()):
+        """:param files: a mapping or iterable of (path, size) pairs"""
+        if isinstance(files, Mapping):
+            files = files.items()
+        self._dirs = []
+        self._dir_ids = {}
+        self._file_dirs = array("I")
+        self._name_ends = array("I")
+        self._sizes = array("q")
+        names = []
+        end = 0
+        for path, size in files:
+            dirname, name = os.path.split(path)
+            if dirname not in self._dir_ids:
+                self._dir_ids[dirname] = len(self._dirs)
+                self._dirs.append(sys.intern(dirname))
+            end += len(name)
+            self._file_dirs.append(self._dir_ids[dirname])
+            self._name_ends.append(end)
+            self._sizes.append(int(size))
+            names.append(name)
+        # All the base names are kept in a single string, and sliced
+        # back out by their end offsets
+        self._names = "".join(names)
+        # Lookup indexes, only built when first needed
+        self._by_name = None
+        self._by_size = None
+
+    def _name(self, index):
+        start = self._name_ends[index - 1] if index else 0
+        return self._names[start : self._name_ends[index]]
+
+    def _path(self, index):
+        return os.path.join(self._dirs[self._file_dirs[index]], self._name(index))
+
+    def _name_index(self):
+        if self._by_name is None:
+            # Built separately so concurrent readers never see it half-full
+            by_name = {}
+            for index in range(len(self)):
+                by_name.setdefault(self._name(index), []).append(index)
+            self._by_name = by_name
+        return self._by_name
+
+    def _find(self, path):
+        dirname, name = os.path.split(path)
+        dir_id = self._dir_ids.get(dirname)
+        for index in self._name_index().get(name, ()):
+            if self._file_dirs[index] == dir_id:
+                return index
+        return None
+
+    def __getitem__(self, path):
+        index = self._find(path)
+        if index is None:
+            raise KeyError(path)
+        return self._sizes[index]
+
+    def __contains__(self, path):
+        return self._find(path) is not None
+
+    def __iter__(self):
+        return (self._path(i) for i in range(len(self)))
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def __repr__(self):
+        return "<ptpapi.Filelist %i files>" % len(self)
+
+    def items(self):
+        return _FilelistItems(self)
+
+    @property
+    def total_size(self):
+        """The combined size of all files"""
+        return sum(self._sizes)
+
+    def by_basename(self, name):
+        """All paths with the given base name
+
+        :rtype: a list of paths"""
+        return [self._path(i) for i in self._name_index().get(name, ())]
+
+    def by_size(self, size):
+        """All paths with exactly the given size
+
+        :rtype: a list of paths"""
+        if self._by_size is None:
+            by_size = {}
+            for index, file_size in enumerate(self._sizes):
+                by_size.setdefault(file_size, []).append(index)
+            self._by_size = by_size
+        return [self._path(i) for i in self._by_size.get(int(size), [])]
+
+
+class _FilelistItems(ItemsView):
+    """Iterate over (path, size) pairs without a lookup for each path"""
+
+    def __iter__(self):
+        filelist = self._mapping
+        for index in range(len(filelist)):
+            yield filelist._path(index), filelist._sizes[index]
@@ -0,0 +1,256 @@
+"""A persistent index of local files, for finding data without walking
+the filesystem"""
+import logging
+import os
+import os.path
+import sqlite3
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+LOGGER = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+  path TEXT PRIMARY KEY,
+  parent TEXT,
+  mtime REAL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+CREATE TABLE IF NOT EXISTS files (
+  dir TEXT,
+  name TEXT,
+  size INTEGER,
+  mtime REAL,
+  device INTEGER,
+  inode INTEGER,
+  PRIMARY KEY (dir, name)
+);
+CREATE INDEX IF NOT EXISTS files_size ON files(size);
+CREATE INDEX IF NOT EXISTS files_name ON files(name);
+"""
+
+
+def _subtree_range(path):
+    """The bounds of all paths strictly underneath a directory, for
+    range queries (os.sep + 1 sorts right after os.sep)"""
+    return (path + os.sep, path + chr(ord(os.sep) + 1))
+
+
+def _check_files(directory, files):
+    """Re-stat the known files in an unchanged directory, since a file
+    can grow or be rewritten in place without touching the directory
+
+    :param files: a dictionary of file names to their indexed (size, mtime)
+    :rtype: a list of (directory, name, fields) tuples for the files that
+        changed, with fields as None if the file is gone"""
+    updated = []
+    for name, indexed in files.items():
+        try:
+            stat = os.stat(os.path.join(directory, name), follow_symlinks=False)
+        except OSError:
+            updated.append((directory, name, None))
+            continue
+        if (stat.st_size, stat.st_mtime) != indexed:
+            updated.append(
+                (
+                    directory,
+                    name,
+                    (stat.st_size, stat.st_mtime, stat.st_dev, stat.st_ino),
+                )
+            )
+    return updated
+
+
+def _scan_device(roots, known):
+    """Scan the roots on a single device, only listing directories whose
+    mtime has changed since the last scan (the files in the others are
+    just re-stat'd)
+
+    :param roots: a list of directories
+    :param known: a dictionary of known directories to (mtime, children,
+        files), with files as a dictionary of names to (size, mtime)
+    :rtype: a tuple of a dictionary of changed directories to (mtime,
+        files, subdirectories), a list of directories that no longer
+        exist, and a list of changed files from _check_files()"""
+    changed = {}
+    removed = []
+    updated = []
+    stack = list(reversed(roots))
+    while stack:
+        directory = stack.pop()
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError:
+            removed.append(directory)
+            continue
+        if directory in known and known[directory][0] == mtime:
+            updated.extend(_check_files(directory, known[directory][2]))
+            stack.extend(reversed(known[directory][1]))
+            continue
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            stat = entry.stat(follow_symlinks=False)
+                            files.append(
+                                (
+                                    entry.name,
+                                    stat.st_size,
+                                    stat.st_mtime,
+                                    stat.st_dev,
+                                    stat.st_ino,
+                                )
+                            )
+                    except OSError as exc:
+                        LOGGER.warning("Could not read %r: %s", entry.path, exc)
+        except OSError as exc:
+            LOGGER.warning("Could not scan %r: %s", directory, exc)
+            continue
+        changed[directory] = (mtime, files, subdirs)
+        stack.extend(reversed(subdirs))
+    return changed, removed, updated
+
+
+class Inventory:
+    """An SQLite-backed index of the files under one or more directories"""
+
+    def __init__(self, db_path):
+        self.db_path = os.path.expanduser(db_path)
+        # Lookups may come from several worker threads
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def update(self, roots, jobs=None):
+        """Bring the index up to date with the filesystem
+
+        Roots on different devices are scanned in parallel, while each
+        device is scanned sequentially to avoid thrashing a single disk.
+
+        :param roots: a list of directories to index
+        :param jobs: the maximum number of devices to scan at once
+        :rtype: the number of directories that were (re-)scanned"""
+        known = {}
+        for path, parent, mtime in self.conn.execute(
+            "SELECT path, parent, mtime FROM dirs"
+        ):
+            known.setdefault(path, [None, [], {}])[0] = mtime
+            if parent is not None:
+                known.setdefault(parent, [None, [], {}])[1].append(path)
+        for directory, name, size, mtime in self.conn.execute(
+            "SELECT dir, name, size, mtime FROM files"
+        ):
+            if directory in known:
+                known[directory][2][name] = (size, mtime)
+        devices = {}
+        for root in roots:
+            root = os.path.abspath(os.path.expanduser(root))
+            try:
+                devices.setdefault(os.stat(root).st_dev, []).append(root)
+            except OSError as exc:
+                LOGGER.error("Could not index %r: %s", root, exc)
+        if not devices:
+            return 0
+        with ThreadPoolExecutor(max_workers=jobs or len(devices)) as pool:
+            results = list(pool.map(lambda r: _scan_device(r, known), devices.values()))
+        scanned = 0
+        with self.lock, self.conn:
+            for changed, removed, updated in results:
+                for directory in removed:
+                    self._remove_tree(directory)
+                for directory, name, fields in updated:
+                    if fields is None:
+                        self.conn.execute(
+                            "DELETE FROM files WHERE dir = ? AND name = ?",
+                            (directory, name),
+                        )
+                    else:
+                        self.conn.execute(
+                            "UPDATE files SET size = ?, mtime = ?, device = ?, inode = ?"
+                            " WHERE dir = ? AND name = ?",
+                            fields + (directory, name),
+                        )
+                for directory, (mtime, files, subdirs) in changed.items():
+                    scanned += 1
+                    for old_subdir in set(known.get(directory, [None, []])[1]) - set(
+                        subdirs
+                    ):
+                        self._remove_tree(old_subdir)
+                    parent = os.path.dirname(directory)
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO dirs (path, parent, mtime) VALUES (?, ?, ?)",
+                        (directory, parent if parent != directory else None, mtime),
+                    )
+                    self.conn.execute("DELETE FROM files WHERE dir = ?", (directory,))
+                    self.conn.executemany(
+                        "INSERT INTO files (dir, name, size, mtime, device, inode) VALUES (?, ?, ?, ?, ?, ?)",
+                        [(directory,) + f for f in files],
+                    )
+        LOGGER.info(
+            "Re-scanned %i changed directories, updated %i changed files",
+            scanned,
+            sum(len(updated) for _, _, updated in results),
+        )
+        return scanned
+
+    def _remove_tree(self, directory):
+        low, high = _subtree_range(directory)
+        self.conn.execute(
+            "DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+            (directory, low, high),
+        )
+        self.conn.execute(
+            "DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)",
+            (directory, low, high),
+        )
+
+    def _query(self, sql, params):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def by_size(self, size):
+        """All indexed paths with exactly the given size"""
+        return [
+            os.path.join(d, n)
+            for d, n in self._query(
+                "SELECT dir, name FROM files WHERE size = ?", (int(size),)
+            )
+        ]
+
+    def by_basename(self, name):
+        """All indexed paths with the given base name"""
+        return [
+            os.path.join(d, n)
+            for d, n in self._query(
+                "SELECT dir, name FROM files WHERE name = ?", (name,)
+            )
+        ]
+
+    def files_under(self, path):
+        """All indexed files at or underneath a path
+
+        :rtype: a dictionary of paths relative to the parent of `path`,
+            to sizes"""
+        base = os.path.dirname(path)
+        low, high = _subtree_range(path)
+        rows = self._query(
+            "SELECT dir, name, size FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)"
+            " ORDER BY dir, name",
+            (path, low, high),
+        )
+        if not rows:
+            rows = self._query(
+                "SELECT dir, name, size FROM files WHERE dir = ? AND name = ?",
+                (base, os.path.basename(path)),
+            )
+        return {os.path.relpath(os.path.join(d, n), base): size for d, n, size in rows}
@@ -0,0 +1,133 @@
+"""A persistent record of reseed attempts, so repeated runs can skip
+paths that were already handled or that keep failing"""
+import logging
+import os.path
+import sqlite3
+import threading
+
+from time import time
+
+
+LOGGER = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+  input TEXT PRIMARY KEY,
+  outcome TEXT,
+  torrent_id INTEGER,
+  failure_reason TEXT,
+  failures INTEGER,
+  requests INTEGER,
+  timestamp REAL
+);
+"""
+
+# Outcomes that mean there's nothing more to do for an input
+SUCCESSES = ("loaded", "already_loaded")
+# The longest a failing input is left alone, as a multiple of the
+# retry delay
+MAX_BACKOFF = 32
+
+
+class ReseedJournal:
+    """An SQLite-backed journal of each input's most recent reseed
+    outcome
+
+    Inputs that succeeded are skipped for `success_age` seconds, and
+    inputs that failed are retried after `retry_after` seconds, doubling
+    for each consecutive failure."""
+
+    def __init__(self, db_path, retry_after=86400, success_age=30 * 86400):
+        self.db_path = os.path.expanduser(db_path)
+        self.retry_after = retry_after
+        self.success_age = success_age
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, key):
+        """The last recorded attempt for an input, or None
+
+        :rtype: a dictionary of the recorded fields"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT outcome, torrent_id, failure_reason, failures, requests, timestamp"
+                " FROM attempts WHERE input = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(
+            zip(
+                (
+                    "outcome",
+                    "torrent_id",
+                    "failure_reason",
+                    "failures",
+                    "requests",
+                    "timestamp",
+                ),
+                row,
+            )
+        )
+
+    def skip_reason(self, key, now=None):
+        """Why an input doesn't need to be tried again yet, or None if it does
+
+        :rtype: a tuple of the reason and the recorded attempt, or None"""
+        attempt = self.get(key)
+        if attempt is None:
+            return None
+        if now is None:
+            now = time()
+        age = now - attempt["timestamp"]
+        if attempt["outcome"] in SUCCESSES:
+            if age < self.success_age:
+                return (
+                    "already {0}".format(attempt["outcome"].replace("_", " ")),
+                    attempt,
+                )
+            return None
+        backoff = self.retry_after * min(
+            2 ** max(attempt["failures"] - 1, 0), MAX_BACKOFF
+        )
+        if age < backoff:
+            return (
+                "failed {0} time(s), last: {1}".format(
+                    attempt["failures"], attempt["failure_reason"]
+                ),
+                attempt,
+            )
+        return None
+
+    def record(self, key, outcome, torrent_id=None, failure_reason=None, requests=0):
+        """Record the outcome of an attempt, committing immediately so an
+        interrupted run can pick up where it left off
+
+        :param outcome: one of 'loaded', 'already_loaded', 'not_found' or
+            'could_not_load'
+        :param requests: the number of requests the attempt made"""
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT failures FROM attempts WHERE input = ?", (key,)
+            ).fetchone()
+            failures = 0
+            if outcome not in SUCCESSES:
+                failures = (row[0] if row else 0) + 1
+            self.conn.execute(
+                "INSERT OR REPLACE INTO attempts"
+                " (input, outcome, torrent_id, failure_reason, failures, requests, timestamp)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    outcome,
+                    torrent_id,
+                    failure_reason,
+                    failures,
+                    requests,
+                    time(),
+                ),
+            )
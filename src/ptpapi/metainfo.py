@@ -0,0 +1,156 @@
+"""Read the interesting parts of a .torrent file straight out of its raw
+bytes, without decoding the (often multi-megabyte) piece hashes"""
+import hashlib
+
+
+def _skip(data, pos):
+    """Find the end of the bencoded value starting at pos"""
+    char = data[pos : pos + 1]
+    if char.isdigit():
+        colon = data.index(b":", pos)
+        return colon + 1 + int(data[pos:colon])
+    if char == b"i":
+        return data.index(b"e", pos) + 1
+    if char in (b"l", b"d"):
+        pos += 1
+        while data[pos : pos + 1] != b"e":
+            if not data[pos : pos + 1]:
+                raise ValueError("Unterminated list or dictionary")
+            pos = _skip(data, pos)
+        return pos + 1
+    raise ValueError("Invalid bencode at offset %i" % pos)
+
+
+def _decode(data, pos):
+    """Fully decode the (small) bencoded value at pos
+
+    :rtype: a tuple of the value and the offset right after it"""
+    char = data[pos : pos + 1]
+    if char.isdigit():
+        colon = data.index(b":", pos)
+        end = colon + 1 + int(data[pos:colon])
+        return bytes(data[colon + 1 : end]), end
+    if char == b"i":
+        end = data.index(b"e", pos)
+        return int(data[pos + 1 : end]), end + 1
+    if char == b"l":
+        pos += 1
+        values = []
+        while data[pos : pos + 1] != b"e":
+            value, pos = _decode(data, pos)
+            values.append(value)
+        return values, pos + 1
+    if char == b"d":
+        pos += 1
+        values = {}
+        while data[pos : pos + 1] != b"e":
+            key, pos = _decode(data, pos)
+            values[key], pos = _decode(data, pos)
+        return values, pos + 1
+    raise ValueError("Invalid bencode at offset %i" % pos)
+
+
+def _text(value):
+    return value.decode("utf-8", errors="surrogateescape")
+
+
+def _entries(data, pos):
+    """Walk over a dictionary one key at a time
+
+    The caller is sent each key and its value's offset, and must send
+    back the offset right after the value.
+
+    :rtype: the offset right after the dictionary"""
+    if data[pos : pos + 1] != b"d":
+        raise ValueError("Expected a dictionary at offset %i" % pos)
+    pos += 1
+    while data[pos : pos + 1] != b"e":
+        if not data[pos : pos + 1]:
+            raise ValueError("Unterminated dictionary")
+        key, pos = _decode(data, pos)
+        pos = yield key, pos
+    return pos + 1
+
+
+def _read_info(data, pos, result):
+    """Fill in the basic fields from the info dictionary at pos
+
+    :rtype: the offset right after the dictionary"""
+    entries = _entries(data, pos)
+    try:
+        key, pos = next(entries)
+        while True:
+            if key == b"name":
+                value, pos = _decode(data, pos)
+                result["name"] = _text(value)
+            elif key == b"length":
+                result["length"], pos = _decode(data, pos)
+            elif key == b"files":
+                files, pos = _decode(data, pos)
+                result["files"] = [
+                    ("/".join(_text(p) for p in f[b"path"]), f[b"length"])
+                    for f in files
+                ]
+                result["length"] = sum(length for _, length in result["files"])
+            else:
+                # The piece hashes are skipped over without being copied
+                pos = _skip(data, pos)
+            key, pos = entries.send(pos)
+    except StopIteration as stop:
+        return stop.value
+
+
+def read_metainfo(data):
+    """Pull the info hash and a few basic fields out of a .torrent file
+
+    The info dictionary is read in place, and hashed directly from the
+    original bytes, without decoding or re-encoding the piece hashes.
+
+    :param data: the raw contents of a .torrent file
+    :rtype: a dictionary with 'info_hash', 'name', 'length' (the total
+        size), 'files' (a list of (path, length) tuples, or None for
+        single file torrents) and 'comment' (or None)
+    :raises ValueError: if the data isn't a usable .torrent file"""
+    try:
+        return _read_metainfo(data)
+    except (AttributeError, IndexError, KeyError, TypeError) as exc:
+        # Valid bencode, but not shaped like a .torrent file, e.g. a
+        # file entry without a path
+        raise ValueError("Malformed .torrent file: %r" % exc) from exc
+
+
+def _read_metainfo(data):
+    result = {"comment": None, "files": None}
+    info = None
+    entries = _entries(data, 0)
+    try:
+        key, pos = next(entries)
+        while True:
+            if key == b"info":
+                end = _read_info(data, pos, result)
+                info = (pos, end)
+                pos = end
+            elif key == b"comment":
+                value, pos = _decode(data, pos)
+                result["comment"] = _text(value)
+            else:
+                pos = _skip(data, pos)
+            key, pos = entries.send(pos)
+    except StopIteration:
+        pass
+    if info is None:
+        raise ValueError("No info dictionary found")
+    result["info_hash"] = (
+        hashlib.sha1(memoryview(data)[info[0] : info[1]]).hexdigest().upper()
+    )
+    if "name" not in result or "length" not in result:
+        raise ValueError("Info dictionary is missing a name or length")
+    if not isinstance(result["length"], int):
+        raise ValueError("Info dictionary has an invalid length")
+    return result
+
+
+def read_metainfo_file(path):
+    """A shortcut for read_metainfo() on a file on disk"""
+    with open(path, "rb") as fh:
+        return read_metainfo(fh.read())
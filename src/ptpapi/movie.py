@@ -1,7 +1,6 @@
 """Represents a movie"""
 import logging
 import operator
-import os.path
 import re
 
 from datetime import datetime
@@ -11,7 +10,7 @@ from bs4 import BeautifulSoup as bs4  # pylint: disable=import-error
 from ptpapi import torrent
 from ptpapi.error import PTPAPIException
 from ptpapi.session import session
-from ptpapi.util import human_to_bytes
+from ptpapi.util import human_to_bytes, invert_key_finder, split_file_sections
 
 
 LOGGER = logging.getLogger(__name__)
@@ -20,32 +19,35 @@ LOGGER = logging.getLogger(__name__)
 class Movie:
     """A class representing a movie"""
 
+    __slots__ = ("ID", "data", "torrents")
+
+    key_finder = {
+        "json": [
+            "ImdbId",
+            "ImdbRating",
+            "ImdbVoteCount",
+            "Torrents",
+            "CoverImage",
+            "Name",
+            "Year",
+        ],
+        "html": [
+            "Title",
+            "Cover",
+            "Tags",
+            "Directors",
+            "PtpRating",
+            "PtpVoteCount",
+            "UserRating",
+            "Seen",
+            "Snatched",
+        ],
+        "inferred": ["Link", "Id", "GroupId"],
+    }
+    field_loaders = invert_key_finder(key_finder)
+
     def __init__(self, ID=None, data=None):
         self.torrents = []
-        self.key_finder = {
-            "json": [
-                "ImdbId",
-                "ImdbRating",
-                "ImdbVoteCount",
-                "Torrents",
-                "CoverImage",
-                "Name",
-                "Year",
-            ],
-            "html": [
-                "Title",
-                "Cover",
-                "Tags",
-                "Directors",
-                "PtpRating",
-                "PtpVoteCount",
-                "UserRating",
-                "Seen",
-                "Snatched",
-            ],
-            "inferred": ["Link", "Id", "GroupId"],
-        }
-
         if data:
             self.data = data
             self.conv_json_torrents()
@@ -64,9 +66,8 @@ class Movie:
 
     def __getitem__(self, name):
         if name not in self.data or self.data[name] is None:
-            for key, val in self.key_finder.items():
-                if name in val:
-                    getattr(self, "load_%s_data" % key)()
+            for loader in self.field_loaders.get(name, ()):
+                getattr(self, loader)()
         return self.data[name]
 
     def items(self):
@@ -105,10 +106,12 @@ class Movie:
 
     def load_html_data(self):
         """Scrape all data from a movie's HTML page"""
-        soup = bs4(
-            session.base_get("torrents.php", params={"id": self.ID, "json": 0}).text,
-            "html.parser",
+        # The file lists can make up most of the page, so they're cut
+        # out and only parsed if a torrent's Filelist is requested
+        page, file_sections = split_file_sections(
+            session.base_get("torrents.php", params={"id": self.ID, "json": 0}).text
         )
+        soup = bs4(page, "html.parser")
         self.data["Cover"] = soup.find("img", class_="sidebar-cover-image")["src"]
         # Title and Year
         match = re.match(
@@ -152,35 +155,10 @@ class Movie:
 
         # File list & trumpability for torrents
         for tor in self.data["Torrents"]:
-            # Get file list
-            filediv = soup.find("div", id="files_%s" % tor.ID)
-            tor.data["Filelist"] = {}
-            basepath = re.match(
-                r"\/(.*)\/", filediv.find("thead").find_all("div")[1].get_text()
-            ).group(1)
-            for elem in filediv.find("tbody").find_all("tr"):
-                try:
-                    bytesize = (
-                        elem("td")[1]("span")[0]["title"]
-                        .replace(",", "")
-                        .replace(" bytes", "")
-                    )
-                except IndexError:
-                    LOGGER.error(
-                        "Could not parse site for filesize, possibly check for bad filenames: https://passthepopcorn.me/torrents.php?torrentid=%s",
-                        tor.ID,
-                    )
-                    continue
-                filepath = os.path.join(basepath, elem("td")[0].string)
-                tor.data["Filelist"][filepath] = bytesize
-            # Check if trumpable
-            if soup.find(id="trumpable_%s" % tor.ID):
-                tor.data["Trumpable"] = [
-                    s.get_text()
-                    for s in soup.find(id="trumpable_%s" % tor.ID).find_all("span")
-                ]
-            else:
-                tor.data["Trumpable"] = []
+            section = file_sections.get(str(tor.ID))
+            tor._file_section = section
+            tor.data.pop("Filelist", None)
+            tor.data["Trumpable"] = torrent.parse_trumpable(soup, section, tor.ID)
 
     def best_match(self, profile):
         """A function to pull the best match of a movie, based on a human-readable filter
@@ -189,101 +167,310 @@ class Movie:
         :rtype: The best matching movie, or None"""
         # We're going to emulate what.cd's collector option
         profiles = profile.lower().split(",")
-        current_sort = None
         if "Torrents" not in self.data:
             self.load_json_data()
         for subprofile in profiles:
             LOGGER.debug("Attempting to match movie to profile '%s'", subprofile)
+            filters, comparisons, current_sort = parse_subprofile(subprofile)
             matches = self.data["Torrents"]
-            simple_filter_dict = {
-                "gp": (lambda t, _: t["GoldenPopcorn"]),
-                "scene": (lambda t, _: t["Scene"]),
-                "576p": (lambda t, _: t["Resolution"] == "576p"),
-                "480p": (lambda t, _: t["Resolution"] == "480p"),
-                "720p": (lambda t, _: t["Resolution"] == "720p"),
-                "1080p": (lambda t, _: t["Resolution"] == "1080p"),
-                "2160p": (lambda t, _: t["Resolution"] == "2160p"),
-                "HD": (lambda t, _: t["Quality"] == "High Definition"),
-                "SD": (lambda t, _: t["Quality"] == "Standard Definition"),
-                "UHD": (lambda t, _: t["Quality"] == "Ultra High Definition"),
-                "not-remux": (lambda t, _: "remux" not in t["RemasterTitle"].lower()),
-                "remux": (lambda t, _: "remux" in t["RemasterTitle"].lower()),
-                "DV": (lambda t, _: "dolby vision" in t["RemasterTitle"].lower()),
-                "HDR10": (lambda t, _: "hdr10" in t["RemasterTitle"].lower()),
-                "HDR10+": (lambda t, _: "hdr10+" in t["RemasterTitle"].lower()),
-                "x264": (lambda t, _: t["Codec"] == "x264"),
-                "H264": (lambda t, _: t["Codec"] == "H.264"),
-                "x265": (lambda t, _: t["Codec"] == "x265"),
-                "H265": (lambda t, _: t["Codec"] == "H.265"),
-                "xvid": (lambda t, _: t["Codec"] == "XviD"),
-                "seeded": (lambda t, _: int(t["Seeders"]) > 0),
-                "not-trumpable": (lambda t, _: not t["Trumpable"]),
-                "unseen": (lambda t, m: not m["Seen"]),
-                "unsnatched": (lambda t, m: not m["Snatched"]),
-            }
-            for name, func in simple_filter_dict.items():
-                if name.lower() in subprofile.split(" "):
-                    matches = [t for t in matches if func(t, self)]
-                    LOGGER.debug(
-                        "%i matches after filtering by parameter '%s'",
-                        len(matches),
-                        name,
-                    )
-            # lambdas that take a torrent, a function for comparison, and a value-as-a-string
-            comparative_filter_dict = {
-                "seeders": (lambda t, f, v: f(int(t["Seeders"]), int(v))),
-                "size": (
-                    lambda t, f, v: f(
-                        int(t["Size"]), human_to_bytes(v, case_sensitive=False)
-                    )
-                ),
-            }
-            comparisons = {
-                ">": operator.gt,
-                ">=": operator.ge,
-                "=": operator.eq,
-                "==": operator.eq,
-                "!=": operator.ne,
-                "<>": operator.ne,
-                "<": operator.lt,
-                "<=": operator.le,
-            }
-            for name, func in comparative_filter_dict.items():
-                match = re.search(r"\b%s([<>=!]+)(.+?)\b" % name, subprofile)
-                if match is not None:
-                    comp_func = comparisons[match.group(1)]
-                    value = match.group(2)
-                    matches = [t for t in matches if func(t, comp_func, value)]
-                    LOGGER.debug(
-                        "%i matches after filtering by parameter '%s'",
-                        len(matches),
-                        name,
-                    )
-            sort_dict = {
-                "most recent": (
-                    True,
-                    (lambda t: datetime.strptime(t["UploadTime"], "%Y-%m-%d %H:%M:%S")),
-                ),
-                "smallest": (
-                    False,
-                    (lambda t: human_to_bytes(t["Size"], case_sensitive=False)),
-                ),
-                "most seeders": (True, (lambda t: int(t["Seeders"]))),
-                "largest": (
-                    True,
-                    (lambda t: human_to_bytes(t["Size"], case_sensitive=False)),
-                ),
-            }
+            for name in filters:
+                func = SIMPLE_FILTERS[name]
+                matches = [t for t in matches if func(t, self)]
+                LOGGER.debug(
+                    "%i matches after filtering by parameter '%s'",
+                    len(matches),
+                    name,
+                )
+            for name, comp_func, value in comparisons:
+                func = COMPARATIVE_FILTERS[name]
+                matches = [t for t in matches if func(t, comp_func, value)]
+                LOGGER.debug(
+                    "%i matches after filtering by parameter '%s'",
+                    len(matches),
+                    name,
+                )
             if len(matches) == 1:
                 return matches[0]
             elif len(matches) > 1:
-                for name, (rev, sort) in sort_dict.items():
-                    if name in subprofile:
-                        current_sort = name
-                if current_sort is None:
-                    current_sort = "most recent"
                 LOGGER.debug("Sorting by parameter %s", current_sort)
-                (rev, sort) = sort_dict[current_sort]
+                (rev, sort) = SORTS[current_sort]
                 return sorted(matches, key=sort, reverse=rev)[0]
         LOGGER.info("Could not find best match for movie %s", self.ID)
         return None
+
+
+# lambdas that take a torrent and its movie
+SIMPLE_FILTERS = {
+    "gp": (lambda t, _: t["GoldenPopcorn"]),
+    "scene": (lambda t, _: t["Scene"]),
+    "576p": (lambda t, _: t["Resolution"] == "576p"),
+    "480p": (lambda t, _: t["Resolution"] == "480p"),
+    "720p": (lambda t, _: t["Resolution"] == "720p"),
+    "1080p": (lambda t, _: t["Resolution"] == "1080p"),
+    "2160p": (lambda t, _: t["Resolution"] == "2160p"),
+    "HD": (lambda t, _: t["Quality"] == "High Definition"),
+    "SD": (lambda t, _: t["Quality"] == "Standard Definition"),
+    "UHD": (lambda t, _: t["Quality"] == "Ultra High Definition"),
+    "not-remux": (lambda t, _: "remux" not in t["RemasterTitle"].lower()),
+    "remux": (lambda t, _: "remux" in t["RemasterTitle"].lower()),
+    "DV": (lambda t, _: "dolby vision" in t["RemasterTitle"].lower()),
+    "HDR10": (lambda t, _: "hdr10" in t["RemasterTitle"].lower()),
+    "HDR10+": (lambda t, _: "hdr10+" in t["RemasterTitle"].lower()),
+    "x264": (lambda t, _: t["Codec"] == "x264"),
+    "H264": (lambda t, _: t["Codec"] == "H.264"),
+    "x265": (lambda t, _: t["Codec"] == "x265"),
+    "H265": (lambda t, _: t["Codec"] == "H.265"),
+    "xvid": (lambda t, _: t["Codec"] == "XviD"),
+    "seeded": (lambda t, _: int(t["Seeders"]) > 0),
+    "not-trumpable": (lambda t, _: not t["Trumpable"]),
+    "unseen": (lambda t, m: not m["Seen"]),
+    "unsnatched": (lambda t, m: not m["Snatched"]),
+}
+
+# Filters that need each movie's HTML page to be loaded
+PAGE_FILTERS = {"not-trumpable", "unseen", "unsnatched"}
+
+# lambdas that take a torrent, a function for comparison, and a value-as-a-string
+COMPARATIVE_FILTERS = {
+    "seeders": (lambda t, f, v: f(int(t["Seeders"]), int(v))),
+    "size": (
+        lambda t, f, v: f(int(t["Size"]), human_to_bytes(v, case_sensitive=False))
+    ),
+}
+
+COMPARISONS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<>": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+# Sort names mapped to (reverse, key function)
+SORTS = {
+    "most recent": (
+        True,
+        (lambda t: datetime.strptime(t["UploadTime"], "%Y-%m-%d %H:%M:%S")),
+    ),
+    "smallest": (
+        False,
+        (lambda t: human_to_bytes(t["Size"], case_sensitive=False)),
+    ),
+    "most seeders": (True, (lambda t: int(t["Seeders"]))),
+    "largest": (
+        True,
+        (lambda t: human_to_bytes(t["Size"], case_sensitive=False)),
+    ),
+}
+
+
+def parse_subprofile(subprofile):
+    """Split a single (lowercased) sub-filter into its parts
+
+    :param subprofile: a filter string without any commas
+    :rtype: a tuple of the simple filter names, a list of
+        (comparative filter name, comparison function, value) tuples,
+        and the name of the sort to use"""
+    words = subprofile.split(" ")
+    filters = [name for name in SIMPLE_FILTERS if name.lower() in words]
+    comparisons = []
+    for name in COMPARATIVE_FILTERS:
+        match = re.search(r"\b%s([<>=!]+)(.+?)\b" % name, subprofile)
+        if match is not None:
+            comparisons.append((name, COMPARISONS[match.group(1)], match.group(2)))
+    current_sort = "most recent"
+    for name in SORTS:
+        if name in subprofile:
+            current_sort = name
+    return filters, comparisons, current_sort
+
+
+def needs_pages(profile):
+    """Whether a filter string uses any filter that has to load each
+    movie's HTML page
+
+    :param profile: a filter string"""
+    return any(
+        name in PAGE_FILTERS
+        for subprofile in profile.lower().split(",")
+        for name in parse_subprofile(subprofile)[0]
+    )
+
+
+def best_match_many(movies, profile):
+    """Find the best match for many movies at once
+
+    The result is the same as calling :meth:`Movie.best_match` on
+    every movie, but if numpy is available all the torrents are
+    flattened into columns so that filtering and sorting happen once
+    per sub-filter instead of once per movie.
+
+    :param movies: a list of movies
+    :param profile: a filter string
+    :rtype: a list of the best matching torrent (or None) for each movie"""
+    try:
+        import numpy  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return [m.best_match(profile) for m in movies]
+
+    torrents = []
+    group_list = []
+    for index, mov in enumerate(movies):
+        if "Torrents" not in mov.data:
+            mov.load_json_data()
+        for tor in mov.data["Torrents"] or []:
+            torrents.append(tor)
+            group_list.append(index)
+    group = numpy.array(group_list, dtype=numpy.int64)
+    pending = numpy.ones(len(movies), dtype=bool)
+    results = [None] * len(movies)
+
+    # Columns are only filled in for torrents that are still
+    # candidates, so that lazily-loaded fields don't trigger any more
+    # requests than the per-movie version would
+    columns = {}
+    filled = {}
+    codes = {}
+    remaster_bits = {"remux": 1, "dolby vision": 2, "hdr10": 4, "hdr10+": 8}
+
+    def remaster_flags(tor):
+        title = tor["RemasterTitle"].lower()
+        return sum(bit for word, bit in remaster_bits.items() if word in title)
+
+    upload_times = {}
+
+    def upload_time(value):
+        if value not in upload_times:
+            upload_times[value] = int(
+                (
+                    datetime.strptime(value, "%Y-%m-%d %H:%M:%S") - datetime(1970, 1, 1)
+                ).total_seconds()
+            )
+        return upload_times[value]
+
+    def code(field, value):
+        return codes.setdefault(field, {}).setdefault(value, len(codes[field]))
+
+    extractors = {
+        "GoldenPopcorn": (bool, lambda t: bool(t["GoldenPopcorn"])),
+        "Scene": (bool, lambda t: bool(t["Scene"])),
+        "Trumpable": (bool, lambda t: bool(t["Trumpable"])),
+        "Seeders": (numpy.int64, lambda t: int(t["Seeders"])),
+        "Size": (
+            numpy.int64,
+            lambda t: human_to_bytes(t["Size"], case_sensitive=False),
+        ),
+        "UploadTime": (numpy.int64, lambda t: upload_time(t["UploadTime"])),
+        "Resolution": (numpy.int32, lambda t: code("Resolution", t["Resolution"])),
+        "Quality": (numpy.int32, lambda t: code("Quality", t["Quality"])),
+        "Codec": (numpy.int32, lambda t: code("Codec", t["Codec"])),
+        "RemasterTitle": (numpy.int8, remaster_flags),
+    }
+
+    def column(field, mask):
+        dtype, func = extractors[field]
+        if field not in columns:
+            columns[field] = numpy.zeros(len(torrents), dtype=dtype)
+            filled[field] = numpy.zeros(len(torrents), dtype=bool)
+        col = columns[field]
+        missing = numpy.flatnonzero(mask & ~filled[field])
+        if len(missing):
+            col[missing] = [func(torrents[i]) for i in missing.tolist()]
+            filled[field] |= mask
+        return col
+
+    def equals(field, value):
+        return lambda mask: column(field, mask) == codes.get(field, {}).get(value, -1)
+
+    def remaster(word):
+        return lambda mask: (column("RemasterTitle", mask) & remaster_bits[word]) > 0
+
+    def movie_flag(field):
+        def flag(mask):
+            values = numpy.zeros(len(movies), dtype=bool)
+            for index in numpy.unique(group[mask]):
+                values[index] = bool(movies[index][field])
+            return values[group]
+
+        return flag
+
+    vector_filters = {
+        "gp": lambda mask: column("GoldenPopcorn", mask),
+        "scene": lambda mask: column("Scene", mask),
+        "576p": equals("Resolution", "576p"),
+        "480p": equals("Resolution", "480p"),
+        "720p": equals("Resolution", "720p"),
+        "1080p": equals("Resolution", "1080p"),
+        "2160p": equals("Resolution", "2160p"),
+        "HD": equals("Quality", "High Definition"),
+        "SD": equals("Quality", "Standard Definition"),
+        "UHD": equals("Quality", "Ultra High Definition"),
+        "not-remux": lambda mask: ~remaster("remux")(mask),
+        "remux": remaster("remux"),
+        "DV": remaster("dolby vision"),
+        "HDR10": remaster("hdr10"),
+        "HDR10+": remaster("hdr10+"),
+        "x264": equals("Codec", "x264"),
+        "H264": equals("Codec", "H.264"),
+        "x265": equals("Codec", "x265"),
+        "H265": equals("Codec", "H.265"),
+        "xvid": equals("Codec", "XviD"),
+        "seeded": lambda mask: column("Seeders", mask) > 0,
+        "not-trumpable": lambda mask: ~column("Trumpable", mask),
+        "unseen": lambda mask: ~movie_flag("Seen")(mask),
+        "unsnatched": lambda mask: ~movie_flag("Snatched")(mask),
+    }
+    vector_comparisons = {
+        "seeders": lambda mask, f, v: f(column("Seeders", mask), int(v)),
+        "size": lambda mask, f, v: f(
+            column("Size", mask), human_to_bytes(v, case_sensitive=False)
+        ),
+    }
+    vector_sorts = {
+        "most recent": (True, "UploadTime"),
+        "smallest": (False, "Size"),
+        "most seeders": (True, "Seeders"),
+        "largest": (True, "Size"),
+    }
+
+    for subprofile in profile.lower().split(","):
+        LOGGER.debug("Attempting to match movies to profile '%s'", subprofile)
+        filters, comparisons, current_sort = parse_subprofile(subprofile)
+        mask = pending[group]
+        for name in filters:
+            mask &= vector_filters[name](mask)
+            LOGGER.debug(
+                "%i matches after filtering by parameter '%s'",
+                numpy.count_nonzero(mask),
+                name,
+            )
+        for name, comp_func, value in comparisons:
+            mask &= vector_comparisons[name](mask, comp_func, value)
+            LOGGER.debug(
+                "%i matches after filtering by parameter '%s'",
+                numpy.count_nonzero(mask),
+                name,
+            )
+        candidates = numpy.flatnonzero(mask)
+        if len(candidates) == 0:
+            continue
+        LOGGER.debug("Sorting by parameter %s", current_sort)
+        (rev, field) = vector_sorts[current_sort]
+        key = column(field, mask)[candidates]
+        if rev:
+            key = -key
+        # Sort by movie, then key, then original position (to keep
+        # the same tie-breaking as the stable sort in best_match)
+        order = candidates[numpy.lexsort((candidates, key, group[candidates]))]
+        sorted_groups = group[order]
+        first = numpy.ones(len(order), dtype=bool)
+        first[1:] = sorted_groups[1:] != sorted_groups[:-1]
+        for index in order[first]:
+            results[group[index]] = torrents[index]
+        pending[sorted_groups[first]] = False
+    for index in numpy.flatnonzero(pending):
+        LOGGER.info("Could not find best match for movie %s", movies[index].ID)
+    return results
@@ -0,0 +1,171 @@
+"""A small parser for scene-style release names
+
+This only understands the common `Title.Year.Resolution.Source.Codec-Group`
+layout (and its space/bracket variants), but is far quicker to import
+and run than guessit, which is kept as a fallback for anything it isn't
+sure about."""
+import logging
+import os.path
+import re
+
+from functools import lru_cache
+
+
+LOGGER = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = {
+    "avi",
+    "iso",
+    "m2ts",
+    "m4v",
+    "mkv",
+    "mp4",
+    "mpg",
+    "ts",
+    "vob",
+    "wmv",
+}
+
+RE_SEPARATORS = re.compile(r"[\s._()\[\]{}]+")
+RE_YEAR = re.compile(r"^(?:19|20)\d\d$")
+RE_RESOLUTION = re.compile(r"^(?:\d{3,4}[pi]|4k|uhd)$", re.IGNORECASE)
+RE_SOURCE = re.compile(
+    r"^(?:blu-?ray|bdrip|brrip|bdremux|remux|hd-?dvd|dvd(?:rip|r|5|9)?|"
+    r"web(?:-?dl|-?rip)?|hdtv|hdrip|tvrip|vhsrip|bd(?:25|50|66|100))$",
+    re.IGNORECASE,
+)
+RE_CODEC = re.compile(
+    r"^(?:[xh]-?26[45]|hevc|avc|xvid|divx|vc-?1|mpeg-?2|av1|vp9)$", re.IGNORECASE
+)
+RE_GROUP = re.compile(r"-([A-Za-z0-9]+)$")
+
+# Words that only ever show up in the tag part of a release name, and so
+# mark the end of the title when there's no year
+STOP_WORDS = {
+    "extended",
+    "proper",
+    "remastered",
+    "repack",
+    "unrated",
+    "limited",
+    "internal",
+    "criterion",
+    "hdr",
+    "dv",
+    "10bit",
+    "dts",
+    "ac3",
+    "aac",
+    "flac",
+    "truehd",
+    "atmos",
+    "dd5",
+}
+
+NORMALIZED_SOURCES = (
+    (re.compile(r"^blu-?ray|^bd", re.IGNORECASE), "Blu-ray"),
+    (re.compile(r"^br", re.IGNORECASE), "Blu-ray"),
+    (re.compile(r"^remux$", re.IGNORECASE), "Blu-ray"),
+    (re.compile(r"^hd-?dvd", re.IGNORECASE), "HD-DVD"),
+    (re.compile(r"^dvd", re.IGNORECASE), "DVD"),
+    (re.compile(r"^web", re.IGNORECASE), "Web"),
+    (re.compile(r"^hdtv|^tvrip", re.IGNORECASE), "TV"),
+    (re.compile(r"^vhs", re.IGNORECASE), "VHS"),
+)
+
+
+def _tag(token):
+    """Classify a token as a tag type, or None if it could be part of the
+    title"""
+    if RE_RESOLUTION.match(token):
+        return "resolution"
+    if RE_SOURCE.match(token):
+        return "source"
+    if RE_CODEC.match(token):
+        return "codec"
+    if token.lower() in STOP_WORDS:
+        return "other"
+    return None
+
+
+@lru_cache(maxsize=4096)
+def parse_release_name(name):
+    """Pull the title, year, resolution, source, codec and release group
+    out of a release name
+
+    Results are cached, since the same names tend to be looked up
+    repeatedly during a reseed run.
+
+    :param name: a file or directory base name
+    :rtype: a dictionary of the parts that were found, plus a
+        'confident' key saying whether the name looked scene-style"""
+    stem, ext = os.path.splitext(name)
+    if ext[1:].lower() in VIDEO_EXTENSIONS:
+        name = stem
+    guess = {}
+    tokens = [t for t in RE_SEPARATORS.split(name) if t]
+    if not tokens:
+        guess["confident"] = False
+        return guess
+    # The group is glued onto the last token, e.g. 'x264-GROUP'
+    match = RE_GROUP.search(tokens[-1])
+    if match and _tag(tokens[-1]) is None:
+        tokens[-1] = tokens[-1][: match.start()]
+        guess["release_group"] = match.group(1)
+        if not tokens[-1]:
+            tokens.pop()
+    first_tag = len(tokens)
+    for index, token in enumerate(tokens):
+        tag = _tag(token)
+        if tag is not None:
+            first_tag = min(first_tag, index)
+            if tag != "other":
+                guess.setdefault(tag, token)
+    # The year is the last year-like token before the tags, as long as
+    # there's something left for the title (e.g. '2001 A Space Odyssey
+    # 1968' or '1917 2019')
+    year_index = None
+    for index in range(min(first_tag, len(tokens)) - 1, 0, -1):
+        if RE_YEAR.match(tokens[index]):
+            year_index = index
+            break
+    title_end = year_index if year_index is not None else first_tag
+    if year_index is not None:
+        guess["year"] = int(tokens[year_index])
+    if title_end:
+        guess["title"] = " ".join(tokens[:title_end])
+    if "resolution" in guess:
+        guess["screen_size"] = guess.pop("resolution").lower()
+        if guess["screen_size"] in ("4k", "uhd"):
+            guess["screen_size"] = "2160p"
+    if "source" in guess:
+        for regex, source in NORMALIZED_SOURCES:
+            if regex.match(guess["source"]):
+                guess["source"] = source
+                break
+    if "codec" in guess:
+        guess["video_codec"] = guess.pop("codec")
+    guess["confident"] = bool(
+        "title" in guess
+        and "year" in guess
+        and ("screen_size" in guess or "source" in guess or "video_codec" in guess)
+    )
+    return guess
+
+
+def guess_release(name):
+    """Parse a release name, handing it off to guessit (if installed)
+    when the quick parser isn't confident
+
+    :param name: a file or directory base name
+    :rtype: a dictionary with at least 'title' when one could be found"""
+    guess = parse_release_name(name)
+    if guess["confident"]:
+        return dict(guess)
+    try:
+        import guessit  # pylint: disable=import-error
+    except ImportError:
+        LOGGER.debug("guessit not installed, using the quick parse for %r", name)
+        return dict(guess)
+    LOGGER.debug("Falling back to guessit for %r", name)
+    return dict(guessit.guessit(name))
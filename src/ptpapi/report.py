@@ -0,0 +1,128 @@
+"""Per-input timings and counters, for reporting where the time in a
+reseed run goes
+
+Work is attributed to whichever report is current in the thread doing
+it, so the code being measured doesn't need to pass reports around."""
+import threading
+
+from contextlib import contextmanager
+from time import perf_counter
+
+
+# Each stage's time excludes any other stage running inside it, e.g.
+# 'load' doesn't include downloading the .torrent file
+STAGES = ("scan", "search", "html", "match", "create", "download", "hash_check", "load")
+
+_local = threading.local()
+
+
+class InputReport:
+    """What happened while reseeding a single input"""
+
+    def __init__(self, path):
+        self.input = path
+        self.outcome = None
+        self.strategy = None
+        self.torrent_id = None
+        self.candidates = 0
+        self.requests = 0
+        self.bytes = 0
+        self.timings = dict.fromkeys(STAGES, 0.0)
+        self.started = perf_counter()
+        # Concurrent find strategies share the same report
+        self.lock = threading.Lock()
+
+    def count(self, candidates=0, requests=0, size=0):
+        with self.lock:
+            self.candidates += candidates
+            self.requests += requests
+            self.bytes += size
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.timings[name] += seconds
+
+    def as_dict(self):
+        return {
+            "input": self.input,
+            "outcome": self.outcome,
+            "strategy": self.strategy,
+            "torrent_id": self.torrent_id,
+            "candidates": self.candidates,
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "timings": {name: round(t, 6) for name, t in self.timings.items()},
+            # Includes any time spent waiting behind other inputs
+            "elapsed": round(perf_counter() - self.started, 6),
+        }
+
+
+def current():
+    """The report for this thread's input, if any"""
+    return getattr(_local, "report", None)
+
+
+@contextmanager
+def reporting(report):
+    """Attribute everything done in this thread to a report (or to
+    nothing, if it's None)"""
+    previous = current()
+    previous_stack = getattr(_local, "stack", None)
+    _local.report = report
+    _local.stack = []
+    try:
+        yield report
+    finally:
+        _local.report = previous
+        _local.stack = previous_stack
+
+
+def bound(func):
+    """Wrap a function to run with the calling thread's report, for
+    handing work off to another thread"""
+    report = current()
+
+    def wrapper(*args, **kwargs):
+        with reporting(report):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+@contextmanager
+def stage(name):
+    """Time a stage for the current report"""
+    report = current()
+    if report is None:
+        yield
+        return
+    stack = _local.stack
+    # The time spent in stages nested inside this one
+    stack.append(0.0)
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - start
+        report.add_time(name, elapsed - stack.pop())
+        if stack:
+            stack[-1] += elapsed
+
+
+def count(candidates=0, requests=0, size=0):
+    """Add to the current report's counters"""
+    report = current()
+    if report is not None:
+        report.count(candidates, requests, size)
+
+
+def _count_response(response, *args, **kwargs):  # pylint: disable=unused-argument
+    if current() is not None:
+        count(requests=1, size=len(response.content))
+
+
+def track_requests(session):
+    """Count each response on a requests session towards the report
+    current in the thread that made it"""
+    if _count_response not in session.hooks["response"]:
+        session.hooks["response"].append(_count_response)
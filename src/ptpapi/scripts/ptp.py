@@ -202,10 +202,17 @@ def search_page(api, args, target, movies, torrents, terms):
 
     if args.download:
         downloaded = 0
-        for movie in movies:
+        if ptpapi.movie.needs_pages(args.filter) or any(
+            "Torrents" not in movie.data for movie in movies
+        ):
+            # Matched one at a time, so that no more pages are loaded
+            # than it takes to reach the limit
+            best_matches = (movie.best_match(args.filter) for movie in movies)
+        else:
+            best_matches = ptpapi.movie.best_match_many(movies, args.filter)
+        for movie, match in zip(movies, best_matches):
             if movie_template:
                 print(movie_template.substitute(movie))
-            match = movie.best_match(args.filter)
             if match:
                 if torrent_template:
                     print(torrent_template.substitute(match))
@@ -281,15 +288,11 @@ def do_log(api, args):
 
 def do_fields(_api, _args):
     print("Movie:")
-    m = ptpapi.Movie(ID=1)
-    for values in m.key_finder.values():
-        for val in values:
-            print(f"- {val}")
+    for val in ptpapi.Movie.field_loaders:
+        print(f"- {val}")
     print("Torrent:")
-    t = ptpapi.Torrent(ID=1)
-    for values in t.key_finder.values():
-        for val in values:
-            print(f"- {val}")
+    for val in ptpapi.Torrent.field_loaders:
+        print(f"- {val}")
 
 
 def do_search_fields(_api, _args):
@@ -396,7 +399,7 @@ def do_origin(api, args):
         p_path = Path(p)
         if p_path.is_dir():
             if args.recursive:
-                for t in p_path.rglob("*.torrent"):
+                for t in ptpapi.scripts.ptp_origin.find_torrents(p_path, args):
                     try:
                         ptpapi.scripts.ptp_origin.write_origin(t, args)
                     except Exception:
@@ -661,6 +664,12 @@ def main():
     origin_parser.add_argument(
         "--no-images", help="Skip downloading images", action="store_true"
     )
+    origin_parser.add_argument(
+        "--torrent-index",
+        help="Keep an SQLite index of .torrent files for --recursive, so unchanged files aren't re-read",
+        default=ptpapi.config.config.get("Main", "torrentIndex", fallback=None),
+        metavar="DB",
+    )
     add_verbosity_args(origin_parser)
     origin_parser.set_defaults(func=do_origin)
 
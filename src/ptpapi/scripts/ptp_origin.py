@@ -13,10 +13,12 @@ import ruamel.yaml
 import urllib3
 
 from bs4 import BeautifulSoup as bs4
-from pyrosimple.util import metafile
 
 import ptpapi
 
+from ptpapi.metainfo import read_metainfo_file
+from ptpapi.torrent_index import RE_COMMENT, TorrentIndex
+
 
 YAML = ruamel.yaml.YAML()
 YAML.top_level_colon_align = True
@@ -24,26 +26,47 @@ YAML.width = float("inf")
 YAML.allow_unicode = True
 YAML.encoding = "utf-8"
 
-RE_COMMENT = re.compile(
-    r"https://passthepopcorn.me/torrents.php\?id=(\d+)&torrentid=(\d+)"
-)
 RE_URL = re.compile(
     r"((http|https)\:\/\/)[a-zA-Z0-9\.\/\?\:@\-_=#]+\.([a-zA-Z]){2,6}([a-zA-Z0-9\.\&\/\?\:@\-_=#])*"
 )
 RE_DELETED_BY = re.compile(r"was deleted by .* for")
 
 
-def write_origin(t, args):
+def find_torrents(directory, args):
+    """The .torrent files to work on under a directory, taken from the
+    torrent index (after bringing it up to date) when there is one
+
+    :rtype: an iterable of (path, index row or None) tuples"""
+    if getattr(args, "torrent_index", None):
+        index = TorrentIndex(args.torrent_index)
+        try:
+            index.update([directory])
+            return [(Path(row["path"]), row) for row in index.ptp_torrents(directory)]
+        finally:
+            index.close()
+    return ((t, None) for t in directory.rglob("*.torrent"))
+
+
+def write_origin(t, args, indexed=None):
+    """Write the origin files for a .torrent file
+
+    :param indexed: the file's row in the torrent index, if there is
+        one, so the file itself doesn't need to be read again"""
     logger = logging.getLogger(__name__)
     mfile_path = Path(t)
-    mfile = metafile.Metafile.from_file(mfile_path)
-    if "comment" not in mfile or not RE_COMMENT.match(mfile["comment"]):
-        logger.info("Skipping file %s, does not contain PTP URL in comment", t)
-        return
+    if indexed is not None:
+        comment = indexed["comment"]
+        group_id, torrent_id = str(indexed["group_id"]), str(indexed["torrent_id"])
+    else:
+        comment = read_metainfo_file(mfile_path)["comment"]
+        match = RE_COMMENT.match(comment or "")
+        if not match:
+            logger.info("Skipping file %s, does not contain PTP URL in comment", t)
+            return
+        group_id, torrent_id = match.groups()
     logger.info("Working file %s", t)
-    match = RE_COMMENT.match(mfile["comment"])
-    movie = ptpapi.Movie(match.group(1))
-    torrent = ptpapi.Torrent(data={"Id": match.group(2), "GroupId": match.group(1)})
+    movie = ptpapi.Movie(group_id)
+    torrent = ptpapi.Torrent(data={"Id": torrent_id, "GroupId": group_id})
     if args.output_directory is not None:
         output_dir = args.output_directory
     else:
@@ -65,7 +88,7 @@ def write_origin(t, args):
         "RemasterTitle": torrent["RemasterTitle"],
         "IMDb": f'https://imdb.com/title/tt{movie["ImdbId"]}',
         "Cover": movie["Cover"],
-        "Permalink": mfile["comment"],
+        "Permalink": comment,
         "InfoHash": torrent["InfoHash"],
         "Codec": torrent["Codec"],
         "Container": torrent["Container"],
@@ -212,6 +235,12 @@ def main():
     parser.add_argument(
         "--no-images", help="Skip downloading images", action="store_true"
     )
+    parser.add_argument(
+        "--torrent-index",
+        help="Keep an SQLite index of .torrent files for --recursive, so unchanged files aren't re-read",
+        default=ptpapi.config.config.get("Main", "torrentIndex", fallback=None),
+        metavar="DB",
+    )
     args = parser.parse_args()
     logging.basicConfig(level=args.loglevel)
     logger = logging.getLogger(__name__)
@@ -220,9 +249,9 @@ def main():
         p_path = Path(p)
         if p_path.is_dir():
             if args.recursive:
-                for t in p_path.rglob("*.torrent"):
+                for t, indexed in find_torrents(p_path, args):
                     try:
-                        write_origin(t, args)
+                        write_origin(t, args, indexed)
                     except Exception:
                         logger.error("Error handling file %s", t)
                         raise
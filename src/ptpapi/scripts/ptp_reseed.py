@@ -1,19 +1,27 @@
 #!/usr/bin/env python
 """Reseed a torrent from PTP, given a path"""
 import argparse
+import errno
+import json
 import logging
 import os
 import os.path
+import shutil
 import sys
+import threading
 
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
 from time import sleep, time
-from typing import Optional, Union
+from typing import Dict, Optional, Tuple, Union
 from urllib.parse import parse_qs, urlparse
 from xmlrpc import client as xmlrpc_client
 
 import bencode
 import bencodepy
+import humanize
 import libtc
 import pyrosimple
 
@@ -21,13 +29,22 @@ from pyrosimple.util import metafile, rpc
 
 import ptpapi
 
+from ptpapi import report, verify
+from ptpapi.inventory import Inventory
+from ptpapi.journal import ReseedJournal
+from ptpapi.metainfo import read_metainfo
+from ptpapi.release import guess_release
+from ptpapi.torrent_index import TorrentIndex
+from ptpapi.watch import DirectoryWatcher
+
 
 class Match:
     """A tiny class to make matching easier
 
     Could be expanded to introduce a confidence indicator
 
-    ID is an integer-as-a-string, and path is filepath"""
+    ID is an integer-as-a-string, and path is filepath. The info hash
+    is only set when it was already known from the torrent's data."""
 
     # pylint: disable=too-few-public-methods
     def __init__(
@@ -36,10 +53,12 @@ class Match:
         path: Optional[os.PathLike] = None,
         matched_files: Optional[dict[str, str]] = None,
         failure_reason: str = "No match",
+        infohash: Optional[str] = None,
     ):
         """A defined match"""
         self.ID = ID
         self.path = path
+        self.infohash = infohash
         if matched_files is None:
             matched_files = {}
         self.matched_files = matched_files
@@ -57,131 +76,403 @@ class Match:
         return "<Match {0}:{1}>".format(self.ID, self.path)
 
 
-def match_by_torrent(torrent, filepath: str) -> Match:
-    """Attempt matching against a torrent ID"""
-    logger = logging.getLogger(__name__)
-    logger.info(
-        "Attempting to match against torrent {0} ({1})".format(
-            torrent.ID, torrent["ReleaseName"]
-        )
-    )
+class RunCache:
+    """Wraps the API to remember searches and movie pages for the rest
+    of the run, so that different strategies and neighbouring inputs
+    don't repeat the same requests"""
 
-    if isinstance(filepath, bytes):
-        filepath = filepath.decode("utf-8")
-    path1 = os.path.abspath(filepath)
-    path1_files = {}
-    if os.path.isdir(path1):
-        for root, _, filenames in os.walk(path1, followlinks=True):
-            for filename in filenames:
-                realpath = os.path.join(root, filename).replace(
-                    os.path.dirname(path1) + os.sep, ""
-                )
-                path1_files[realpath] = os.path.getsize(os.path.join(root, filename))
-    elif os.path.isfile(path1):
-        path1_files[os.path.basename(path1)] = os.path.getsize(path1)
+    def __init__(self, ptp):
+        self.ptp = ptp
+        self.searches: Dict[tuple, list] = {}
+        self.movies: Dict[str, ptpapi.Movie] = {}
+        self.torrents: Dict[str, ptpapi.Torrent] = {}
+        self.html_loaded: set = set()
+        self.hits = {"search": 0, "movie": 0}
+        self.lock = threading.Lock()
+        self.key_locks: Dict[tuple, threading.Lock] = defaultdict(threading.Lock)
+        self.started = time()
 
-    path2_files = dict((f, int(s)) for f, s in torrent["Filelist"].items())
+    def expire(self, max_age):
+        """Forget everything once the cache is older than max_age
+        seconds, so a long-running watch can see new uploads"""
+        with self.lock:
+            if time() - self.started < max_age:
+                return
+            self.searches.clear()
+            self.movies.clear()
+            self.torrents.clear()
+            self.html_loaded.clear()
+            self.key_locks.clear()
+            self.started = time()
 
-    if len(path1_files) < len(path2_files):
-        logger.debug(
-            "Too little files to match torrent ({0} locally, {1} in torrent)".format(
-                len(path1_files), len(path2_files)
+    def _key_lock(self, key) -> threading.Lock:
+        with self.lock:
+            return self.key_locks[key]
+
+    def movie(self, movie_id) -> ptpapi.Movie:
+        """The single shared Movie object for a group ID"""
+        with self.lock:
+            return self.movies.setdefault(str(movie_id), ptpapi.Movie(ID=movie_id))
+
+    def torrent(self, torrent_id) -> ptpapi.Torrent:
+        """The single shared Torrent object for a torrent ID"""
+        with self.lock:
+            return self.torrents.setdefault(
+                str(torrent_id), ptpapi.Torrent(ID=torrent_id)
             )
+
+    def search(self, filters):
+        """A memoized version of API.search, returning shared Movie objects"""
+        key = tuple(sorted((k, str(v).strip().lower()) for k, v in filters.items()))
+        with self._key_lock(("search", key)):
+            if key in self.searches:
+                with self.lock:
+                    self.hits["search"] += 1
+                return self.searches[key]
+            movies = []
+            with report.stage("search"):
+                found = self.ptp.search(dict(filters))
+            for movie in found:
+                with self.lock:
+                    movies.append(self.movies.setdefault(str(movie.ID), movie))
+            self.searches[key] = movies
+            return movies
+
+    def load_html_data(self, movie):
+        """Load a movie's HTML page, unless it's already been loaded this run"""
+        with self._key_lock(("movie", str(movie.ID))):
+            if str(movie.ID) in self.html_loaded:
+                with self.lock:
+                    self.hits["movie"] += 1
+                return
+            with report.stage("html"):
+                movie.load_html_data()
+            self.html_loaded.add(str(movie.ID))
+
+
+@lru_cache(maxsize=None)
+def rtorrent_proxy():
+    """The rtorrent connection for this run, opened on first use"""
+    return pyrosimple.connect().open()
+
+
+def wait_for_hash(proxy, infohash: str):
+    """Wait until rtorrent has finished loading a torrent, checking
+    quickly at first and backing off to once a second"""
+    delay = 0.01
+    while True:
+        try:
+            proxy.d.hash(infohash)
+            return
+        except (xmlrpc_client.Fault, rpc.HashNotFound):
+            pass
+        sleep(delay)
+        delay = min(delay * 2, 1)
+
+
+class ClientState:
+    """A snapshot of what's already in the torrent client, taken once at
+    the start of a run instead of asking the client about every torrent"""
+
+    def __init__(self, client=None):
+        self.client = client
+        # Info hash to whether the torrent is complete
+        self.complete: Dict[str, bool] = {}
+        # Absolute data path to info hash
+        self.paths: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """(Re-)read the client's full list of torrents"""
+        logger = logging.getLogger(__name__)
+        complete = {}
+        paths = {}
+        if self.client is None:
+            proxy = rtorrent_proxy()
+            for (
+                infohash,
+                is_complete,
+                directory,
+                name,
+                is_multi_file,
+            ) in proxy.d.multicall2(
+                "",
+                "main",
+                "d.hash=",
+                "d.complete=",
+                "d.directory=",
+                "d.name=",
+                "d.is_multi_file=",
+            ):
+                complete[infohash.upper()] = bool(is_complete)
+                if directory:
+                    # d.directory already includes the name for multi-file torrents
+                    if not is_multi_file:
+                        directory = os.path.join(directory, name)
+                    paths[os.path.abspath(directory)] = infohash.upper()
+        elif isinstance(self.client, str) and self.client.startswith("file://"):
+            pass
+        else:
+            # libtc can only list paths one torrent at a time, so only
+            # the hashes are indexed
+            for torrent in self.client.list():
+                complete[torrent.infohash.upper()] = torrent.progress == 100
+        with self.lock:
+            self.complete = complete
+            self.paths = paths
+        logger.debug(
+            "Found %i torrents (%i paths) in the client", len(complete), len(paths)
         )
-        return Match(
-            None,
-            failure_reason="Too little files to match torrent ({0} locally, {1} in torrent)".format(
-                len(path1_files), len(path2_files)
-            ),
-        )
 
+    def add(self, infohash: str, path, complete: bool = False):
+        """Record a torrent that was just loaded"""
+        with self.lock:
+            self.complete[infohash.upper()] = complete
+            self.paths[os.path.abspath(path)] = infohash.upper()
+
+    def is_complete(self, infohash: str) -> Union[bool, None]:
+        """None if the torrent isn't loaded, otherwise whether it's complete"""
+        return self.complete.get(infohash.upper())
+
+    def has_path(self, path) -> bool:
+        """Whether a torrent's data is already loaded from exactly this path"""
+        return os.path.abspath(path) in self.paths
+
+
+def match_files(
+    path1_files: Dict[str, int], path2_files: Dict[str, int]
+) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """Pair up local files with torrent files, by progressively looser
+    comparisons of their paths and sizes
+
+    Each pass uses a dictionary index of the remaining torrent files,
+    and when several torrent files could match a local file, the first
+    one in the torrent's order wins.
+
+    :param path1_files: local relative paths to sizes
+    :param path2_files: torrent paths to sizes
+    :rtype: a tuple of matched local paths to torrent paths, and the
+        torrent files that could not be matched"""
+    logger = logging.getLogger(__name__)
+    path1_files = dict(path1_files)
+    path2_files = dict(path2_files)
+    total = len(path2_files)
     matched_files = {}
+
+    def log_progress():
+        logger.debug("{0} of {1} files matched".format(len(matched_files), total))
+
+    def claim(index, key):
+        """Pop the first torrent path for key that hasn't been matched yet"""
+        candidates = index.get(key)
+        while candidates:
+            filename2 = candidates.popleft()
+            if filename2 in path2_files:
+                return filename2
+        return None
+
+    def build_index(key_func):
+        index = defaultdict(deque)
+        for filename2, size2 in path2_files.items():
+            index[key_func(filename2, size2)].append(filename2)
+        return index
+
+    def no_root(filename):
+        return os.sep.join(os.path.normpath(filename).split(os.sep)[1:])
+
     logger.debug("Looking for exact matches")
     for filename, size in list(path1_files.items()):
-        if filename in path2_files.keys() and path2_files[filename] == size:
+        if path2_files.get(filename) == size:
             matched_files[filename] = filename
             del path1_files[filename]
             del path2_files[filename]
-    logger.debug(
-        "{0} of {1} files matched".format(
-            len(matched_files), len(path2_files) + len(matched_files)
-        )
-    )
+    log_progress()
 
     logger.debug(
         "Looking for matches with same size and name but different root folder"
     )
+    index = build_index(lambda f, s: (no_root(f), s))
     for filename1, size1 in list(path1_files.items()):
-        no_root1 = os.sep.join(os.path.normpath(filename1).split(os.sep)[1:])
-        for filename2, size2 in list(list(path2_files.items())):
-            no_root2 = os.sep.join(os.path.normpath(filename2).split(os.sep)[1:])
-            if no_root1 == no_root2 and size1 == size2:
-                matched_files[filename1] = filename2
-                del path1_files[filename1]
-                del path2_files[filename2]
-                break
-    logger.debug(
-        "{0} of {1} files matched".format(
-            len(matched_files), len(path2_files) + len(matched_files)
-        )
-    )
+        filename2 = claim(index, (no_root(filename1), size1))
+        if filename2 is not None:
+            matched_files[filename1] = filename2
+            del path1_files[filename1]
+            del path2_files[filename2]
+    log_progress()
 
-    logger.debug("Looking for matches with same base name and size")
+    # There used to be a pass here for matching by base name and size,
+    # but it required the base name to not exist in the remaining
+    # torrent files, which can never be true for a candidate, so it
+    # never matched anything and has been dropped.
+
+    logger.debug("Looking for matches by size only")
+    index = build_index(lambda f, s: s)
     for filename1, size1 in list(path1_files.items()):
-        for filename2, size2 in list(path2_files.items()):
-            if (
-                os.path.basename(filename1) == os.path.basename(filename2)
-                and size1 == size2
-            ):
-                if os.path.basename(filename1) not in [
-                    os.path.basename(p) for p in path2_files.keys()
-                ]:
-                    matched_files[filename1] = filename2
-                    del path1_files[filename1]
-                    del path2_files[filename2]
-                    break
-    logger.debug(
-        "{0} of {1} files matched".format(
-            len(matched_files), len(path2_files) + len(matched_files)
+        filename2 = claim(index, size1)
+        if filename2 is not None:
+            logger.debug("Matched {0} to {1}".format(filename1, filename2))
+            matched_files[filename1] = filename2
+            del path1_files[filename1]
+            del path2_files[filename2]
+    log_progress()
+
+    return matched_files, path2_files
+
+
+class LocalPath:
+    """The files found under a local path
+
+    The path is only scanned the first time the files are needed, and
+    then reused for every torrent it's compared against."""
+
+    def __init__(self, filepath: Union[str, bytes, os.PathLike]):
+        if isinstance(filepath, bytes):
+            filepath = filepath.decode("utf-8")
+        self.path = os.path.abspath(filepath)
+        self._files: Optional[Dict[str, int]] = None
+        self._inodes: Dict[str, Tuple[int, int]] = {}
+        # Several find strategies may ask for the files at the same time
+        self._lock = threading.Lock()
+
+    def _scanned(self):
+        with self._lock:
+            if self._files is None:
+                with report.stage("scan"):
+                    self.scan()
+
+    @property
+    def files(self) -> Dict[str, int]:
+        """Paths relative to the parent directory, mapped to sizes"""
+        if self._files is None:
+            self._scanned()
+        return self._files
+
+    @property
+    def inodes(self) -> Dict[str, Tuple[int, int]]:
+        """Relative paths mapped to their (device, inode)"""
+        if self._files is None:
+            self._scanned()
+        return self._inodes
+
+    def scan(self):
+        """(Re-)scan the path, in the same order os.walk would"""
+        logger = logging.getLogger(__name__)
+        files: Dict[str, int] = {}
+        inodes: Dict[str, Tuple[int, int]] = {}
+
+        def add(relpath: str, stat: os.stat_result):
+            files[relpath] = stat.st_size
+            inodes[relpath] = (stat.st_dev, stat.st_ino)
+
+        if os.path.isdir(self.path):
+            dirs = [(self.path, os.path.basename(self.path))]
+            while dirs:
+                directory, reldir = dirs.pop()
+                subdirs = []
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            relpath = os.path.join(reldir, entry.name)
+                            try:
+                                if entry.is_dir():
+                                    subdirs.append((entry.path, relpath))
+                                else:
+                                    add(relpath, entry.stat())
+                            except OSError as exc:
+                                logger.warning("Could not read %r: %s", entry.path, exc)
+                except OSError as exc:
+                    logger.warning("Could not scan %r: %s", directory, exc)
+                dirs.extend(reversed(subdirs))
+        elif os.path.isfile(self.path):
+            add(os.path.basename(self.path), os.stat(self.path))
+        # Only publish the results once they're complete
+        self._inodes = inodes
+        self._files = files
+
+
+def match_by_torrent(
+    torrent, filepath: Union[str, bytes], local: Optional[LocalPath] = None
+) -> Match:
+    """Attempt matching against a torrent ID"""
+    logger = logging.getLogger(__name__)
+    logger.info(
+        "Attempting to match against torrent {0} ({1})".format(
+            torrent.ID, torrent["ReleaseName"]
         )
     )
 
-    logger.debug("Looking for matches by size only")
-    for filename1, size1 in list(path1_files.items()):
-        for filename2, size2 in list(path2_files.items()):
-            logger.debug(
-                "Comparing size of {0} ({1}) to size of {2} ({3})".format(
-                    filename1, size1, filename2, size2
-                )
+    if local is None:
+        local = LocalPath(filepath)
+    report.count(candidates=1)
+    path1_files = local.files
+    path2_files = torrent["Filelist"]
+
+    if len(path1_files) < len(path2_files):
+        logger.debug(
+            "Too little files to match torrent ({0} locally, {1} in torrent)".format(
+                len(path1_files), len(path2_files)
             )
-            if size1 == size2:
-                logger.debug("Matched {0} to {1}".format(filename1, filename2))
-                matched_files[filename1] = filename2
-                del path1_files[filename1]
-                del path2_files[filename2]
-                break
-    logger.debug(
-        "{0} of {1} files matched".format(
-            len(matched_files), len(path2_files) + len(matched_files)
         )
-    )
+        return Match(
+            None,
+            failure_reason="Too little files to match torrent ({0} locally, {1} in torrent)".format(
+                len(path1_files), len(path2_files)
+            ),
+        )
+
+    with report.stage("match"):
+        matched_files, path2_files = match_files(path1_files, path2_files)
 
     if len(path2_files) > 0:
         logger.info("Not all files could be matched, returning...")
         return Match(
-            None, f"Not all files could be matched ({len(path2_files)} remaining)"
+            None,
+            failure_reason=f"Not all files could be matched ({len(path2_files)} remaining)",
         )
-    return Match(torrent.ID, Path(os.path.dirname(path1)), matched_files)
+    return Match(
+        torrent.ID,
+        Path(os.path.dirname(local.path)),
+        matched_files,
+        infohash=torrent.data.get("InfoHash"),
+    )
 
 
-def match_by_movie(movie, filepath) -> Match:
+def match_by_movie(
+    movie, filepath, local: Optional[LocalPath] = None, ptp=None
+) -> Match:
     """Tries to match a torrent against a single movie"""
     logger = logging.getLogger(__name__)
     logger.info("Attempting to match against movie %s (%r)", movie.ID, movie["Title"])
 
-    movie.load_html_data()
-    for torrent in movie["Torrents"]:
-        match = match_by_torrent(torrent, os.path.abspath(filepath))
+    if local is None:
+        local = LocalPath(filepath)
+    # Every torrent file has to match a local file of the same size,
+    # so the torrent can't be larger than the local path, and shouldn't
+    # be much smaller either. This only needs the sizes from the movie
+    # JSON, so it's checked before loading the HTML page.
+    local_size = sum(local.files.values())
+    tolerance = ptpapi.config.config.getfloat("Reseed", "sizeTolerance") / 100
+    torrents = [
+        t
+        for t in movie["Torrents"]
+        if local_size * (1 - tolerance) <= int(t["Size"]) <= local_size
+    ]
+    if not torrents:
+        logger.debug("No torrents within size range of %i bytes", local_size)
+        return Match(
+            None,
+            failure_reason="No torrents in movie {0} ({1}) are close to the local size".format(
+                movie.ID, movie["Title"]
+            ),
+        )
+    torrents.sort(key=lambda t: local_size - int(t["Size"]))
+    if isinstance(ptp, RunCache):
+        ptp.load_html_data(movie)
+    else:
+        with report.stage("html"):
+            movie.load_html_data()
+    for torrent in torrents:
+        match = match_by_torrent(torrent, local.path, local)
         if match:
             return match
     return Match(
@@ -192,19 +483,60 @@ def match_by_movie(movie, filepath) -> Match:
     )
 
 
-def match_by_guessed_name(ptp, filepath, limit, name=None) -> Match:
-    """Use guessit to find the movie by metadata scraped from the filename"""
+def match_by_inventory(torrent, inventory: Inventory) -> Match:
+    """Look for a torrent's files anywhere in the inventory, without
+    touching the filesystem"""
+    logger = logging.getLogger(__name__)
+    path2_files = torrent["Filelist"]
+    if not path2_files:
+        return Match(None, failure_reason="Torrent has no files")
+    # The largest file has the most distinctive size
+    path2, size2 = max(path2_files.items(), key=lambda f: f[1])
+    depth = len(Path(path2).parts)
+    checked = set()
+    for candidate in inventory.by_size(size2):
+        # Work back up to where the torrent's top level would be
+        top = candidate
+        for _ in range(depth - 1):
+            top = os.path.dirname(top)
+        if top in checked:
+            continue
+        checked.add(top)
+        logger.debug("Checking files under %r", top)
+        report.count(candidates=1)
+        with report.stage("match"):
+            path1_files = inventory.files_under(top)
+            if len(path1_files) < len(path2_files):
+                continue
+            matched_files, remaining = match_files(path1_files, path2_files)
+        if not remaining:
+            return Match(
+                torrent.ID,
+                Path(os.path.dirname(top)),
+                matched_files,
+                infohash=torrent.data.get("InfoHash"),
+            )
+    return Match(None, failure_reason="Could not find matching files in the inventory")
+
+
+def match_by_guessed_name(
+    ptp,
+    filepath,
+    limit,
+    name=None,
+    local: Optional[LocalPath] = None,
+    cancel: Optional[threading.Event] = None,
+) -> Match:
+    """Find the movie by metadata scraped from the filename
+
+    Scene-style names are parsed directly, with guessit (if installed)
+    used for anything else."""
     logger = logging.getLogger(__name__)
     filepath = os.path.abspath(filepath)
-    try:
-        import guessit  # pylint: disable=import-error
-    except ImportError:
-        logger.warning("Error importing 'guessit' module, skipping name guess")
-        return Match(None, failure_reason="Error importing 'guessit' module")
-    logger.info("Guessing name from filepath with guessit")
+    logger.info("Guessing name from filepath")
     if not name:
         name = os.path.basename(filepath)
-    guess = guessit.guessit(name)
+    guess = guess_release(name)
     if "title" not in guess:
         return Match(
             None, failure_reason=f"Could not find title from filename {name!r}"
@@ -222,8 +554,12 @@ def match_by_guessed_name(ptp, filepath, limit, name=None) -> Match:
                 None,
                 failure_reason="Could not find any movies by search with a guessed name",
             )
+        if local is None:
+            local = LocalPath(filepath)
         for movie in movies[:limit]:
-            match = match_by_movie(movie, filepath)
+            if cancel is not None and cancel.is_set():
+                return Match(None, failure_reason="Cancelled")
+            match = match_by_movie(movie, filepath, local, ptp)
             if match:
                 return match
     return Match(
@@ -231,23 +567,136 @@ def match_by_guessed_name(ptp, filepath, limit, name=None) -> Match:
     )
 
 
-def match_against_file(ptp, filepath, movie_limit) -> Match:
+def match_against_file(
+    ptp,
+    filepath,
+    movie_limit,
+    local: Optional[LocalPath] = None,
+    cancel: Optional[threading.Event] = None,
+) -> Match:
     """Use's PTP's file search feature to match a filename to a movie"""
     logger = logging.getLogger(__name__)
     filepath = os.path.abspath(filepath)
+    if local is None:
+        local = LocalPath(filepath)
     logger.info("Searching movies by file list")
     for movie in ptp.search({"filelist": os.path.basename(filepath)})[:movie_limit]:
-        match = match_by_movie(movie, filepath)
+        if cancel is not None and cancel.is_set():
+            return Match(None, failure_reason="Cancelled")
+        match = match_by_movie(movie, filepath, local, ptp)
         if match:
             return match
     return Match(None, failure_reason="Could not find any match by filename")
 
 
-def create_matched_files(match, directory=None, action="hard", dry_run=False):
-    """Intelligently create any necessary files or directories by different methods"""
+# From linux/fs.h
+FICLONE = 0x40049409
+
+
+def reflink_file(src, dst):
+    """Make a copy-on-write clone of a file (btrfs, XFS and others)"""
+    import fcntl  # pylint: disable=import-outside-toplevel
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+
+
+def copy_file(src, dst):
+    """Copy a file's contents inside the kernel where possible
+    (copy_file_range, then sendfile), falling back to a plain copy
+
+    The data is copied to a temporary name first, so an interrupted
+    copy is never mistaken for a finished file."""
+    tmp = dst + ".part"
+    try:
+        with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            copied = 0
+            for method in ("copy_file_range", "sendfile"):
+                if not hasattr(os, method):
+                    continue
+                try:
+                    while copied < size:
+                        if method == "copy_file_range":
+                            sent = os.copy_file_range(
+                                fsrc.fileno(), fdst.fileno(), size - copied
+                            )
+                        else:
+                            sent = os.sendfile(
+                                fdst.fileno(), fsrc.fileno(), copied, size - copied
+                            )
+                        if not sent:
+                            break
+                        copied += sent
+                    break
+                except OSError as exc:
+                    # Not supported between these filesystems, try the next
+                    # method from where this one got to
+                    if exc.errno not in (
+                        errno.EXDEV,
+                        errno.ENOSYS,
+                        errno.EINVAL,
+                        errno.EOPNOTSUPP,
+                    ):
+                        raise
+            if copied < size:
+                fsrc.seek(copied)
+                fdst.seek(copied)
+                shutil.copyfileobj(fsrc, fdst, 4 * 1024 * 1024)
+        shutil.copymode(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        # Including KeyboardInterrupt, so a cancelled copy doesn't leave
+        # the partial file behind either
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def create_file(src, dst, action):
+    """Create a single file using the given action
+
+    'auto' tries a hard link, then a reflink, then a full copy.
+
+    :rtype: the action that was actually used"""
+    if action == "soft":
+        os.symlink(src, dst)
+    elif action == "hard":
+        os.link(src, dst)
+    elif action == "reflink":
+        reflink_file(src, dst)
+    elif action == "copy":
+        copy_file(src, dst)
+    elif action == "auto":
+        for attempt, method in (("hard", os.link), ("reflink", reflink_file)):
+            try:
+                method(src, dst)
+                return attempt
+            except OSError as exc:
+                logging.getLogger(__name__).debug(
+                    "Could not %s link %r: %s", attempt, dst, exc
+                )
+        copy_file(src, dst)
+        return "copy"
+    return action
+
+
+def create_matched_files(match, directory=None, action="hard", dry_run=False, jobs=4):
+    """Intelligently create any necessary files or directories by different methods
+
+    Copies (and any reflinks or copies made by 'auto') run in a thread
+    pool of the given size, since they can take a while for large files."""
     logger = logging.getLogger(__name__)
     if dry_run:
         logger.info("Dry run, no files or directories will be created")
+    to_create = []
     for origin_file, matched_file in match.matched_files.items():
         origin_file = os.path.join(match.path, origin_file)
         if directory is None:
@@ -272,22 +721,46 @@ def create_matched_files(match, directory=None, action="hard", dry_run=False):
                 file_to_create, origin_file, action
             )
         )
-        if not dry_run:
-            if action == "soft":
-                os.symlink(origin_file, file_to_create)
-            elif action == "hard":
-                os.link(origin_file, file_to_create)
-            elif action == "skip":
-                continue
+        if not dry_run and action != "skip":
+            to_create.append((origin_file, file_to_create))
+    if action in ("soft", "hard") or len(to_create) <= 1:
+        for origin_file, file_to_create in to_create:
+            create_file(origin_file, file_to_create, action)
+    elif to_create:
+        total = sum(os.path.getsize(f) for f, _ in to_create)
+        done = 0
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                pool.submit(create_file, origin_file, file_to_create, action): (
+                    origin_file,
+                    file_to_create,
+                )
+                for origin_file, file_to_create in to_create
+            }
+            for count, future in enumerate(as_completed(futures), 1):
+                used = future.result()
+                done += os.path.getsize(futures[future][0])
+                logger.info(
+                    "Created %i/%i files (%s of %s), last via %s",
+                    count,
+                    len(to_create),
+                    humanize.naturalsize(done, binary=True),
+                    humanize.naturalsize(total, binary=True),
+                    used,
+                )
     match.path = directory
     return match
 
 
-def is_torrent_complete(infohash: str, client=None) -> Union[bool, None]:
+def is_torrent_complete(
+    infohash: str, client=None, state: Optional[ClientState] = None
+) -> Union[bool, None]:
     """This returns a sort of horrible ternary: None if the torrent
     does not exist, True if it's complete, and false otherwise."""
+    if state is not None:
+        return state.is_complete(infohash)
     if client is None:
-        proxy = pyrosimple.connect().open()
+        proxy = rtorrent_proxy()
         try:
             if proxy.d.complete(infohash):
                 return True
@@ -306,34 +779,76 @@ def is_torrent_complete(infohash: str, client=None) -> Union[bool, None]:
 
 
 def load_torrent(
-    ID, path, client=None, hash_check=False, overwrite_incomplete=False
+    ID,
+    path,
+    client=None,
+    hash_check=False,
+    overwrite_incomplete=False,
+    state: Optional[ClientState] = None,
+    hash_jobs: Optional[int] = None,
+    quick_verify: Optional[int] = None,
+    torrent_index: Optional[TorrentIndex] = None,
+    infohash: Optional[str] = None,
 ) -> bool:
-    """Send a torrent to rtorrent and kick off the hash recheck"""
+    """Send a torrent to rtorrent and kick off the hash recheck
+
+    :param state: a client snapshot to record the torrent in once it's loaded
+    :param hash_jobs: the number of processes to hash check with
+    :param quick_verify: the number of pieces to sample before loading (or
+        before a full hash check)
+    :param torrent_index: an index to look for an existing .torrent file
+        in before downloading one
+    :param infohash: the info hash the torrent is expected to have, if
+        known, so that no other indexed file is used for it"""
     logger = logging.getLogger(__name__)
-    torrent = ptpapi.Torrent(ID=ID)
-    torrent_data = torrent.download()
-    data = metafile.Metafile(bencode.bdecode(torrent_data))
-    thash = data.info_hash()
+    torrent_data = None
+    if torrent_index is not None:
+        for row in torrent_index.by_torrent_id(ID):
+            if infohash and row["info_hash"] != infohash.upper():
+                continue
+            try:
+                with open(row["path"], "rb") as fh:
+                    torrent_data = fh.read()
+            except OSError:
+                continue
+            logger.info("Using existing .torrent file %r", row["path"])
+            break
+    if torrent_data is None:
+        with report.stage("download"):
+            torrent_data = ptpapi.Torrent(ID=ID).download()
+    meta = read_metainfo(torrent_data)
+    thash = meta["info_hash"]
     path = Path(path)
+    check_path = path
+    if meta["files"] is not None:
+        check_path = Path(path, meta["name"])
+    if quick_verify or hash_check:
+        # Only fully decoded when the piece hashes are needed
+        data = metafile.Metafile(bencode.bdecode(torrent_data))
+    if quick_verify:
+        try:
+            with report.stage("hash_check"):
+                checked = verify.quick_check(data["info"], check_path, quick_verify)
+        except OSError as exc:
+            logger.error("Quick verification failed: %s", exc)
+            return False
+        logger.debug("Quick verification passed (%i pieces)", checked)
     if hash_check:
-        from pyrosimple.util.metafile import PieceFailer
-
         logger.debug("Starting hash check against %r", str(path))
-        pf = PieceFailer(data)
         try:
-            check_path = path
-            if data.is_multi_file:
-                check_path = Path(path, data["info"]["name"])
-            data.hash_check(check_path, piece_callback=pf.check_piece)
-            data.add_fast_resume(check_path)
+            with report.stage("hash_check"):
+                verify.hash_check(data["info"], check_path, jobs=hash_jobs)
+                data.add_fast_resume(check_path)
         except OSError as exc:
             logger.error("Could not complete hash check: %s", exc)
             return False
+        # Send the resume data along with the torrent
+        torrent_data = data.bencode()
     if client is None:
         hash_exists = False
-        proxy = pyrosimple.connect().open()
+        proxy = rtorrent_proxy()
         try:
-            logger.debug("Testing for hash {0}".format(proxy.d.hash(thash)))
+            logger.debug("Testing for hash {0}".format(thash))
             if proxy.d.complete(thash):
                 logger.error(
                     "Hash {0} is already completed in rtorrent as {1}, cannot load.".format(
@@ -352,30 +867,40 @@ def load_torrent(
             )
             return False
         proxy.load.raw("", xmlrpc_client.Binary(torrent_data))
-        # Wait until the torrent is loaded and available
-        while True:
-            sleep(1)
-            try:
-                proxy.d.hash(thash)
-                break
-            except (xmlrpc_client.Fault, rpc.HashNotFound):
-                pass
+        wait_for_hash(proxy, thash)
         logger.info("Torrent loaded at %r", str(path))
-        proxy.d.custom.set(thash, "tm_completed", str(int(time())))
-        proxy.d.directory.set(thash, str(path))
-        if hash_check and not overwrite_incomplete:
-            proxy.d.start(thash)
-        else:
-            proxy.d.check_hash(thash)
-        return True
+        # Sent as a single round trip, run in order by rtorrent
+        calls = [
+            ("d.custom.set", [thash, "tm_completed", str(int(time()))]),
+            ("d.directory.set", [thash, str(path)]),
+            (
+                "d.start"
+                if hash_check and not overwrite_incomplete
+                else "d.check_hash",
+                [thash],
+            ),
+        ]
+        results = proxy.system.multicall(
+            [{"methodName": name, "params": params} for name, params in calls]
+        )
+        loaded = True
+        for (name, _), result in zip(calls, results):
+            if isinstance(result, dict) and "faultCode" in result:
+                logger.error(
+                    "Could not run %s on %s: %s", name, thash, result["faultString"]
+                )
+                loaded = False
     elif isinstance(client, str) and client.startswith("file://"):
-        dest = Path(client[7:], data["info"]["name"] + ".torrent").expanduser()
+        dest = Path(client[7:], meta["name"] + ".torrent").expanduser()
         logger.info("Saving file to %r", str(dest))
-        data.save(dest)
+        dest.write_bytes(torrent_data)
         return True
     else:
         bd = bencodepy.BencodeDecoder()
-        return bool(client.add(bd.decode(torrent_data), path))
+        loaded = bool(client.add(bd.decode(torrent_data), path))
+    if loaded and state is not None:
+        state.add(thash, Path(path, meta["name"]))
+    return loaded
 
 
 def define_parser():
@@ -400,7 +925,7 @@ def define_parser():
         "-a",
         "--action",
         help="Method to use when creating files",
-        choices=["hard", "soft", "skip"],
+        choices=["hard", "soft", "reflink", "copy", "auto", "skip"],
         default=ptpapi.config.config.get("Reseed", "action"),
     )
     parser.add_argument(
@@ -453,6 +978,122 @@ def define_parser():
         help="Hash check against any found matches before loading",
         action="store_true",
     )
+    parser.add_argument(
+        "--quick-verify",
+        help="Hash a sample of pieces (first, last, file boundaries and random ones) and skip the match if any are bad",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--quick-verify-pieces",
+        help="How many pieces --quick-verify checks",
+        type=int,
+        default=ptpapi.config.config.getint("Reseed", "quickVerifyPieces", fallback=16),
+        metavar="N",
+    )
+    parser.add_argument(
+        "--hash-jobs",
+        help="Number of processes to use for --hash-check (default: one per CPU)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Scan and match up to N paths at once (requests still share the same rate limit)",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--concurrent-find",
+        help="Try all the Reseed.findBy methods for a path at once, and take the first match",
+        action="store_true",
+        default=ptpapi.config.config.getboolean(
+            "Reseed", "concurrentFind", fallback=False
+        ),
+    )
+    parser.add_argument(
+        "--inventory",
+        help="Path to an SQLite index of local files, used with --update-inventory and --reverse",
+        default=ptpapi.config.config.get("Reseed", "inventory", fallback=None),
+    )
+    parser.add_argument(
+        "--update-inventory",
+        help="Index (or re-index any changes in) a directory before reseeding, can be specified multiple times",
+        action="append",
+        default=[],
+        metavar="DIR",
+    )
+    parser.add_argument(
+        "--torrent-index",
+        help="Path to an SQLite index of .torrent files, checked before downloading a torrent from PTP",
+        default=ptpapi.config.config.get("Main", "torrentIndex", fallback=None),
+        metavar="DB",
+    )
+    parser.add_argument(
+        "--update-torrent-index",
+        help="Index (or re-index any changes in) a directory of .torrent files before reseeding, can be specified multiple times",
+        action="append",
+        default=[],
+        metavar="DIR",
+    )
+    parser.add_argument(
+        "--reverse",
+        help="Treat the inputs as torrent permalinks or IDs, and look for their files in the inventory",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--report",
+        help="Write a line for each input with its outcome, counters and per-stage timings",
+        choices=["json"],
+    )
+    parser.add_argument(
+        "--report-file",
+        help="Where to append the --report lines (defaults to stdout)",
+        default="-",
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "--watch",
+        help="Keep running, and reseed new files/directories as they appear in DIR (can be repeated)",
+        action="append",
+        metavar="DIR",
+    )
+    parser.add_argument(
+        "--quiet-period",
+        help="Seconds a new path must go unchanged before it's reseeded (with --watch)",
+        type=float,
+        default=ptpapi.config.config.getfloat(
+            "Reseed", "watchQuietPeriod", fallback=60
+        ),
+        metavar="SECONDS",
+    )
+    parser.add_argument(
+        "--cache-age",
+        help="Hours to keep reusing searches and movie pages for (with --watch)",
+        type=float,
+        default=ptpapi.config.config.getfloat("Reseed", "watchCacheAge", fallback=6),
+        metavar="HOURS",
+    )
+    parser.add_argument(
+        "--journal",
+        help="Path to an SQLite journal of past attempts, used to skip inputs that were already loaded or recently failed",
+        default=ptpapi.config.config.get("Reseed", "journal", fallback=None),
+        metavar="DB",
+    )
+    parser.add_argument(
+        "--retry-after",
+        help="Hours to wait before retrying an input that failed, doubled for each further failure (with --journal)",
+        type=float,
+        default=ptpapi.config.config.getfloat("Reseed", "retryAfter", fallback=24),
+        metavar="HOURS",
+    )
+    parser.add_argument(
+        "--success-age",
+        help="Days to keep skipping an input after it was loaded (with --journal)",
+        type=float,
+        default=ptpapi.config.config.getfloat("Reseed", "successAge", fallback=30),
+        metavar="DAYS",
+    )
     parser.add_argument(
         "--overwrite-incomplete",
         help="If the torrent exists as incomplete, change the path of the existing torrent (rtorrent only)",
@@ -461,6 +1102,161 @@ def define_parser():
     return parser
 
 
+def find_match(args, ptp, filename, local: LocalPath) -> Match:
+    """Try each of the configured methods of finding a match for a path"""
+    logger = logging.getLogger("ptp-reseed")
+    match = Match(None)
+    strategy_used = None
+    if args.url:
+        strategy_used = "url"
+        parsed_url = parse_qs(urlparse(args.url).query)
+        if "torrentid" in parsed_url:
+            match = match_by_torrent(
+                ptp.torrent(parsed_url["torrentid"][0]), filename, local
+            )
+        elif "id" in parsed_url:
+            match = match_by_movie(ptp.movie(parsed_url["id"][0]), filename, local, ptp)
+    elif filename:
+        strategies = []
+        for match_type in ptpapi.config.config.get("Reseed", "findBy").split(","):
+            if match_type == "filename":
+                strategies.append(
+                    (
+                        match_type,
+                        lambda cancel: match_against_file(
+                            ptp, filename, args.limit, local, cancel
+                        ),
+                    )
+                )
+            elif match_type == "title":
+                strategies.append(
+                    (
+                        match_type,
+                        lambda cancel: match_by_guessed_name(
+                            ptp, filename, args.limit, local=local, cancel=cancel
+                        ),
+                    )
+                )
+            else:
+                logger.error(
+                    "Match type {0} not recognized for {1}, skipping".format(
+                        match_type, filename
+                    )
+                )
+        try:
+            if args.concurrent_find and len(strategies) > 1:
+                strategy_used, match = find_match_concurrently(strategies)
+            else:
+                for strategy_used, strategy in strategies:
+                    match = strategy(None)
+                    if match:
+                        break
+        except Exception:
+            print("Error while attempting to match file '{0}'".format(filename))
+            raise
+    input_report = report.current()
+    if input_report is not None and match:
+        input_report.strategy = strategy_used
+    return match
+
+
+def find_match_concurrently(strategies) -> Tuple[str, Match]:
+    """Run several find strategies at once, and return the first match
+
+    The strategies share the same session, and so the same rate limit.
+    Once one of them finds a match the others are told to stop before
+    checking their next movie.
+
+    :param strategies: a list of names and functions taking a cancellation
+        event
+    :rtype: the name of the strategy and the first successful match, or
+        else the failure from the first strategy"""
+    cancel = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=len(strategies))
+    futures = {
+        pool.submit(report.bound(strategy), cancel): name
+        for name, strategy in strategies
+    }
+    try:
+        for future in as_completed(futures):
+            match = future.result()
+            if match:
+                return futures[future], match
+    finally:
+        # Don't wait for the other strategies to notice, they may be in
+        # the middle of a request
+        cancel.set()
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=False)
+    first = next(iter(futures))
+    return futures[first], first.result()
+
+
+def reseed_match(
+    args,
+    client,
+    match: Match,
+    state: Optional[ClientState] = None,
+    torrent_index: Optional[TorrentIndex] = None,
+) -> str:
+    """Create any files needed by a match, and load it into the client
+
+    :rtype: one of 'loaded', 'would_load', 'already_loaded' (when the
+        torrent is already complete in the client) or 'could_not_load'"""
+    logger = logging.getLogger("ptp-reseed")
+    # Checking the hash first avoids spending a download (and creating
+    # files) on a torrent that's already loaded
+    infohash = match.infohash
+    if infohash is None and torrent_index is not None:
+        for row in torrent_index.by_torrent_id(match.ID):
+            infohash = row["info_hash"]
+            break
+    if infohash and state is not None:
+        complete = state.is_complete(infohash)
+        if complete or (complete is not None and not args.overwrite_incomplete):
+            logger.error(
+                "Hash {0} is already {1} in the client, cannot load.".format(
+                    infohash, "completed" if complete else "loaded"
+                )
+            )
+            if complete:
+                return "already_loaded"
+            return "could_not_load"
+    if args.create_in_directory:
+        create_in = args.create_in_directory
+    elif ptpapi.config.config.has_option("Reseed", "createInDirectory"):
+        create_in = ptpapi.config.config.get("Reseed", "createInDirectory")
+    else:
+        create_in = None
+    with report.stage("create"):
+        create_matched_files(
+            match, directory=create_in, action=args.action, dry_run=args.dry_run
+        )
+    logger.info(
+        "Found match, now loading torrent {0} to path {1}".format(match.ID, match.path)
+    )
+    if args.dry_run:
+        logger.debug("Dry-run: Stopping before actual load")
+        return "would_load"
+    with report.stage("load"):
+        loaded = load_torrent(
+            match.ID,
+            Path(match.path),
+            client,
+            hash_check=args.hash_check,
+            overwrite_incomplete=args.overwrite_incomplete,
+            state=state,
+            hash_jobs=args.hash_jobs,
+            quick_verify=args.quick_verify_pieces if args.quick_verify else None,
+            torrent_index=torrent_index,
+            infohash=match.infohash,
+        )
+    if loaded:
+        return "loaded"
+    return "could_not_load"
+
+
 def process(cli_args):
     """The entrypoint"""
     parser = define_parser()
@@ -472,21 +1268,42 @@ def process(cli_args):
     # Futile attempt to impose our loglevel upon pyroscope
     logging.basicConfig(level=args.loglevel)
 
+    inventory = None
+    if args.inventory:
+        inventory = Inventory(args.inventory)
+        if args.update_inventory:
+            inventory.update(args.update_inventory)
+    elif args.update_inventory or args.reverse:
+        parser.error("--update-inventory and --reverse require --inventory")
+
+    torrent_index = None
+    if args.torrent_index:
+        torrent_index = TorrentIndex(args.torrent_index)
+        if args.update_torrent_index:
+            torrent_index.update(args.update_torrent_index)
+    elif args.update_torrent_index:
+        parser.error("--update-torrent-index requires --torrent-index")
+
     # Load PTP API
-    ptp = ptpapi.login()
+    ptp = RunCache(ptpapi.login())
 
-    loaded = []
-    would_load = []
-    could_not_load = []
+    results = {
+        "loaded": [],
+        "would_load": [],
+        "could_not_load": [],
+        "already_loaded": [],
+        "journal_skipped": [],
+    }
     not_found = []
 
-    if args.files in (["-"], []):
+    if args.watch and not args.files:
+        # Only new arrivals, unless some paths are given explicitly
+        filelist = []
+    elif args.files in (["-"], []):
         filelist = sys.stdin
     else:
         filelist = args.files
 
-    loaded_paths = []
-
     if args.client:
         if args.client[0].startswith("file://"):
             client = args.client[0]
@@ -495,56 +1312,130 @@ def process(cli_args):
     else:
         client = None
 
-    for filename in filelist:
-        match = Match(None)
+    # Fetched once, so already seeded paths can be skipped without
+    # touching PTP or asking the client again
+    state = ClientState(client)
+    try:
+        state.refresh()
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning("Could not read the client's torrents: %s", exc)
+
+    journal = None
+    if args.journal:
+        journal = ReseedJournal(
+            args.journal,
+            retry_after=args.retry_after * 3600,
+            success_age=args.success_age * 86400,
+        )
+    avoided = {"inputs": 0, "requests": 0}
+
+    def journal_key(filename):
+        return filename if args.reverse else os.path.abspath(filename)
+
+    def record(filename, outcome, **kwargs):
+        # A dry run shouldn't change what later runs skip
+        if journal is not None and not args.dry_run:
+            # Counted per thread, so other inputs' requests aren't included
+            input_report = report.current()
+            if input_report is not None:
+                kwargs["requests"] = input_report.requests
+            journal.record(journal_key(filename), outcome, **kwargs)
+
+    def journal_skip(filename):
+        if journal is None:
+            return None
+        return journal.skip_reason(journal_key(filename))
+
+    report_file = None
+    if args.report or journal is not None:
+        report.track_requests(ptpapi.session.session)
+    if args.report:
+        if args.report_file == "-":
+            report_file = sys.stdout
+        else:
+            report_file = open(  # pylint: disable=consider-using-with
+                os.path.expanduser(args.report_file), "a", encoding="utf-8"
+            )
+
+    def match_input(filename):
         filename = filename.strip("\n")
+        # For --report and the journal's request counts. Handed along
+        # with the match, since the same input can be given twice
+        input_report = None
+        if args.report or journal is not None:
+            input_report = report.InputReport(filename)
+        with report.reporting(input_report):
+            match, skipped = find_input_match(filename, input_report)
+        return filename, match, skipped, input_report
 
-        logger.info('Starting reseed attempt on file "{0}"'.format(filename))
+    def find_input_match(filename, input_report):
+        """Look for a match for an input, in a pool thread
+
+        Inputs skipped before matching are only noted here, and acted
+        on by handle_input, so the summary stays in input order.
 
+        :rtype: a tuple of the match (or None), and None or a tuple of
+            the outcome it was skipped with and any details"""
+        if args.reverse:
+            skip = journal_skip(filename)
+            if skip is not None:
+                return None, ("journal_skipped", skip)
+            logger.info('Looking for local data for torrent "{0}"'.format(filename))
+            torrent_id = parse_qs(urlparse(filename).query).get("torrentid", [filename])
+            if input_report is not None:
+                input_report.strategy = "inventory"
+            match = match_by_inventory(ptpapi.Torrent(ID=torrent_id[0]), inventory)
+            return match, None
+        logger.info('Starting reseed attempt on file "{0}"'.format(filename))
         if not os.path.exists(filename):
             logger.error("File/directory {0} does not exist".format(filename))
-            continue
+            return None, ("missing", None)
+        if state.has_path(filename):
+            return None, ("already_loaded", None)
+        skip = journal_skip(filename)
+        if skip is not None:
+            return None, ("journal_skipped", skip)
+        # Only scanned once, no matter how many torrents it's checked against
+        local = LocalPath(filename)
+        return find_match(args, ptp, filename, local), None
 
-        if args.url:
-            parsed_url = parse_qs(urlparse(args.url).query)
-            if "torrentid" in parsed_url:
-                match = match_by_torrent(
-                    ptpapi.Torrent(ID=parsed_url["torrentid"][0]), filename.encode()
-                )
-            elif "id" in parsed_url:
-                match = match_by_movie(
-                    ptpapi.Movie(ID=parsed_url["id"][0]), filename.encode()
-                )
-        elif filename:
-            for match_type in ptpapi.config.config.get("Reseed", "findBy").split(","):
-                try:
-                    if match_type == "filename":
-                        if os.path.abspath(filename) in loaded_paths:
-                            logger.info(
-                                "Path {0} already in rtorrent, skipping".format(
-                                    os.path.abspath(filename)
-                                )
-                            )
-                        else:
-                            logger.debug(
-                                "Path {0} not in rtorrent".format(
-                                    os.path.abspath(filename)
-                                )
-                            )
-                            match = match_against_file(ptp, filename, args.limit)
-                    elif match_type == "title":
-                        match = match_by_guessed_name(ptp, filename, args.limit)
-                    else:
-                        logger.error(
-                            "Match type {0} not recognized for {1}, skipping".format(
-                                match_type, filename
-                            )
-                        )
-                    if match:
-                        break
-                except Exception:
-                    print("Error while attempting to match file '{0}'".format(filename))
-                    raise
+    def handle_input(filename, match, skipped, input_report):
+        with report.reporting(input_report):
+            if skipped is not None:
+                outcome = handle_skip(filename, *skipped)
+            else:
+                outcome = handle_match(filename, match)
+        if input_report is not None:
+            if outcome is not None:
+                input_report.outcome = outcome
+            if match:
+                input_report.torrent_id = match.ID
+        if input_report is not None and report_file is not None:
+            report_file.write(json.dumps(input_report.as_dict()) + "\n")
+            report_file.flush()
+
+    def handle_skip(filename, outcome, details):
+        """Act on an input that was skipped before matching
+
+        :rtype: the outcome"""
+        if outcome == "already_loaded":
+            logger.info("Path {0} is already loaded in the client".format(filename))
+            results["already_loaded"].append(filename)
+            record(filename, "already_loaded")
+        elif outcome == "journal_skipped":
+            reason, attempt = details
+            logger.info("Skipping {0}, {1}".format(filename, reason))
+            results["journal_skipped"].append("{0} ({1})".format(filename, reason))
+            avoided["inputs"] += 1
+            avoided["requests"] += attempt["requests"] or 0
+        return outcome
+
+    def handle_match(filename, match):
+        """Act on the match for an input
+
+        :rtype: the outcome, or None if there was nothing to match"""
+        if match is None:
+            return None
 
         # Make sure we have the minimum information required
         if not match:
@@ -554,40 +1445,74 @@ def process(cli_args):
                 filename,
                 match.failure_reason,
             )
-            continue
-
-        if args.create_in_directory:
-            create_in = args.create_in_directory
-        elif ptpapi.config.config.has_option("Reseed", "createInDirectory"):
-            create_in = ptpapi.config.config.get("Reseed", "createInDirectory")
-        else:
-            create_in = None
-        create_matched_files(
-            match, directory=create_in, action=args.action, dry_run=args.dry_run
-        )
-        logger.info(
-            "Found match, now loading torrent {0} to path {1}".format(
-                match.ID, match.path
+            record(
+                filename,
+                "not_found",
+                failure_reason=match.failure_reason,
             )
-        )
+            return "not_found"
+
         match_log_line = (
             f"https://passthepopcorn.me/torrents.php?torrentid={match.ID} -> {filename}"
         )
-        if args.dry_run:
-            would_load.append(match_log_line)
-            logger.debug("Dry-run: Stopping before actual load")
-            continue
-        if load_torrent(
-            match.ID,
-            Path(match.path),
-            client,
-            hash_check=args.hash_check,
-            overwrite_incomplete=args.overwrite_incomplete,
-        ):
-            loaded.append(match_log_line)
-        else:
-            could_not_load.append(match_log_line)
+        outcome = reseed_match(args, client, match, state, torrent_index)
+        results[outcome].append(match_log_line)
+        if outcome != "would_load":
+            record(
+                filename,
+                outcome,
+                torrent_id=match.ID,
+                failure_reason="Could not load"
+                if outcome == "could_not_load"
+                else None,
+            )
+        return outcome
+
+    if args.jobs > 1:
+        # Scanning and matching happen in the pool, while creating
+        # files and loading into the client stay in this thread, in
+        # the same order as the inputs
+        pool = ThreadPoolExecutor(max_workers=args.jobs)
+        match_all = pool.map
+    else:
+        pool = None
+        match_all = map
 
+    for filename, match, skipped, input_report in match_all(match_input, filelist):
+        handle_input(filename, match, skipped, input_report)
+
+    if args.watch:
+        watcher = DirectoryWatcher(args.watch, quiet_period=args.quiet_period)
+        logger.info("Watching %s for new files", ", ".join(watcher.roots))
+        try:
+            for paths in watcher.settled():
+                logger.info("New paths: %s", ", ".join(paths))
+                # Picks up anything the client itself finished
+                # downloading, which shouldn't be matched again
+                try:
+                    state.refresh()
+                except Exception as exc:  # pylint: disable=broad-except
+                    logger.warning("Could not read the client's torrents: %s", exc)
+                ptp.expire(args.cache_age * 3600)
+                for filename, match, skipped, input_report in match_all(
+                    match_input, paths
+                ):
+                    handle_input(filename, match, skipped, input_report)
+        except KeyboardInterrupt:
+            logger.info("Stopped watching")
+        finally:
+            watcher.close()
+
+    if pool is not None:
+        pool.shutdown()
+    if journal is not None:
+        journal.close()
+    if report_file is not None and report_file is not sys.stdout:
+        report_file.close()
+
+    loaded = results["loaded"]
+    would_load = results["would_load"]
+    could_not_load = results["could_not_load"]
     if args.summary:
         if loaded:
             print("==> Loaded:")
@@ -601,6 +1526,23 @@ def process(cli_args):
         if not_found:
             print("==> Not found:")
             print("\n".join(not_found))
+        if results["already_loaded"]:
+            print("==> Already loaded:")
+            print("\n".join(results["already_loaded"]))
+        if results["journal_skipped"]:
+            print("==> Skipped by the journal:")
+            print("\n".join(results["journal_skipped"]))
+            print(
+                "==> Avoided about {0} request(s) for {1} input(s) handled in earlier runs".format(
+                    avoided["requests"], avoided["inputs"]
+                )
+            )
+        if ptp.hits["search"] or ptp.hits["movie"]:
+            print(
+                "==> Reused {0} search(es) and {1} movie page(s) from earlier in the run".format(
+                    ptp.hits["search"], ptp.hits["movie"]
+                )
+            )
 
     exit_code = 0
     if len(not_found) == 1:
@@ -5,8 +5,10 @@ import argparse
 import json
 import logging
 
+from collections import defaultdict
 from datetime import datetime
 from pathlib import Path
+from typing import Dict, List, Optional, Set
 from urllib.parse import parse_qs, urljoin, urlparse
 
 import requests
@@ -119,30 +121,62 @@ def main():
                     filters[arg.split("=")[0]] = arg.split("=")[1]
             torrents = ptp.need_for_seed(filters)[: args.limit]
 
+        prowlarr = ProwlarrSearch()
         for t in torrents:
             if not any(f"torrentid={t.ID}" in h["infoUrl"] for h in history):
-                find_match(args, t)
+                find_match(args, t, prowlarr)
 
 
-# Stolen from https://en.wikibooks.org/wiki/Algorithm_Implementation/Strings/Levenshtein_distance#Python
-def levenshtein(s1: str, s2: str):
-    """Measure the edit distance between two strings"""
-    if len(s1) < len(s2):
-        return levenshtein(s2, s1)  # pylint: disable=arguments-out-of-order
+def levenshtein(s1: str, s2: str, max_distance: Optional[int] = None) -> int:
+    """Measure the edit distance between two strings
 
-    if len(s2) == 0:
+    When only the distances up to max_distance matter, anything further
+    apart returns max_distance + 1, usually without comparing most of
+    the strings: only a band of max_distance cells on either side of the
+    diagonal is filled in, and it stops as soon as a whole row is over
+    the limit."""
+    if len(s1) < len(s2):
+        s1, s2 = s2, s1
+    if max_distance is None:
+        max_distance = len(s1)
+    # Every extra character costs at least one edit
+    if len(s1) - len(s2) > max_distance:
+        return max_distance + 1
+    if s1 == s2:
+        return 0
+    if max_distance == 0:
+        return 1
+    # A shared prefix or suffix never changes the distance
+    start = 0
+    while start < len(s2) and s1[start] == s2[start]:
+        start += 1
+    end1, end2 = len(s1), len(s2)
+    while end2 > start and s1[end1 - 1] == s2[end2 - 1]:
+        end1 -= 1
+        end2 -= 1
+    s1, s2 = s1[start:end1], s2[start:end2]
+    if not s2:
         return len(s1)
 
-    previous_row = list(range(len(s2) + 1))
-    for i, c1 in enumerate(s1):
-        current_row = [i + 1]
-        for j, c2 in enumerate(s2):
-            insertions = (
-                previous_row[j + 1] + 1
-            )  # j+1 instead of j since previous_row and current_row are one character longer
-            deletions = current_row[j] + 1  # than s2
-            substitutions = previous_row[j] + (c1 != c2)
-            current_row.append(min(insertions, deletions, substitutions))
+    limit = max_distance + 1
+    previous_row = [min(j, limit) for j in range(len(s2) + 1)]
+    for i, c1 in enumerate(s1, 1):
+        # Cells outside the band are already over the limit
+        current_row = [limit] * (len(s2) + 1)
+        current_row[0] = min(i, limit)
+        row_min = current_row[0]
+        for j in range(max(1, i - max_distance), min(len(s2), i + max_distance) + 1):
+            cost = min(
+                previous_row[j] + 1,
+                current_row[j - 1] + 1,
+                previous_row[j - 1] + (c1 != s2[j - 1]),
+                limit,
+            )
+            current_row[j] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min >= limit:
+            return limit
         previous_row = current_row
 
     return previous_row[-1]
@@ -165,6 +199,143 @@ def sort_title(title: str) -> str:
     return " ".join(splitTitle)
 
 
+class TitleIndex:
+    """Finds every title within a small edit distance of another, without
+    comparing against each one
+
+    Titles are split into overlapping n-grams, and each edit changes at
+    most n of them, so a title within k edits of another shares all but
+    k * n of its n-grams with it (the q-gram lemma). Any match must then
+    contain at least one of the title's k * n + 1 rarest n-grams, and
+    only the titles found that way get a full comparison."""
+
+    N = 3
+
+    def __init__(self, titles: List[Optional[str]]):
+        """:param titles: the titles to index, with None for any to leave out"""
+        self.titles = titles
+        self.postings: Dict[str, list] = defaultdict(list)
+        self.by_length: Dict[int, list] = defaultdict(list)
+        for index, title in enumerate(titles):
+            if title is None:
+                continue
+            self.by_length[len(title)].append(index)
+            for gram in set(self._grams(title)):
+                self.postings[gram].append(index)
+
+    @classmethod
+    def _grams(cls, title: str) -> List[str]:
+        # Padded so that the ends of a title count as much as the middle
+        padded = "\0" * (cls.N - 1) + title + "\0" * (cls.N - 1)
+        return [padded[i : i + cls.N] for i in range(len(padded) - cls.N + 1)]
+
+    def near(self, title: str, max_distance: int) -> Set[int]:
+        """The indexes of every title within max_distance edits of title"""
+        grams = self._grams(title)
+        # How many n-grams are left untouched by max_distance edits
+        shared = len(grams) - max_distance * self.N
+        candidates: Set[int] = set()
+        if shared > 0:
+            grams.sort(key=lambda g: len(self.postings.get(g, ())))
+            for gram in grams[: len(grams) - shared + 1]:
+                candidates.update(self.postings.get(gram, ()))
+        else:
+            # Short enough that a match needn't share any n-grams at all
+            for length in range(
+                max(len(title) - max_distance, 0), len(title) + max_distance + 1
+            ):
+                candidates.update(self.by_length.get(length, ()))
+        return {
+            index
+            for index in candidates
+            if levenshtein(title, self.titles[index], max_distance) <= max_distance
+        }
+
+
+class SearchResults:
+    """The results of a single Prowlarr search, with the usenet titles
+    indexed on first use"""
+
+    def __init__(self, results: List[dict]):
+        self.results = results
+        self._indexes: Dict[str, TitleIndex] = {}
+        # Everything else is matched by size, and always has to be checked
+        self.not_usenet = [
+            i for i, r in enumerate(results) if r.get("protocol") != "usenet"
+        ]
+
+    def _index(self, key: str) -> TitleIndex:
+        if key not in self._indexes:
+            self._indexes[key] = TitleIndex(
+                [
+                    r.get(key) if r.get("protocol") == "usenet" else None
+                    for r in self.results
+                ]
+            )
+        return self._indexes[key]
+
+    def close_titles(self, ptp_result: dict, title_distance=1) -> Set[int]:
+        """The indexes of the usenet results whose title or sort title is
+        close enough to the PTP result's for match_results()"""
+        close = self._index("title").near(ptp_result["title"], title_distance)
+        if ptp_result.get("sortTitle") is not None:
+            close |= self._index("sortTitle").near(
+                ptp_result["sortTitle"], title_distance
+            )
+        return close
+
+
+class ProwlarrSearch:
+    """Runs searches against Prowlarr, and keeps each response (and its
+    title indexes) for the rest of the run, since torrents from the same
+    movie often send exactly the same queries"""
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.session.headers.update({"X-Api-Key": config.get("Prowlarr", "api_key")})
+        self.responses: Dict[tuple, SearchResults] = {}
+
+    def search(self, params: dict) -> SearchResults:
+        key = tuple(sorted(params.items()))
+        if key not in self.responses:
+            self.responses[key] = SearchResults(
+                self.session.get(
+                    urljoin(config.get("Prowlarr", "url"), "api/v1/search"),
+                    params=params,
+                ).json()
+            )
+        return self.responses[key]
+
+
+def first_match(
+    ptp_result: dict,
+    search_results: SearchResults,
+    ignore_tracker: str,
+    ignore_indexers=(),
+    title_distance=1,
+) -> dict:
+    """The first search result that match_results() accepts, skipping
+    the usenet results whose titles are too far off to ever match"""
+    logger = logging.getLogger("reseed-machine.match")
+    close = search_results.close_titles(ptp_result, title_distance)
+    logger.debug(
+        "%i of %i results are usenet with close titles",
+        len(close),
+        len(search_results.results),
+    )
+    # Checked in the original order, so the same result wins as before
+    for index in sorted(close.union(search_results.not_usenet)):
+        other_result = search_results.results[index]
+        if other_result["indexer"] in ignore_indexers:
+            continue
+        download = match_results(
+            ptp_result, other_result, ignore_tracker, title_distance
+        )
+        if download:
+            return download
+    return {}
+
+
 def match_results(
     ptp_result: dict, other_result: dict, ignore_tracker: str, title_distance=1
 ) -> dict:
@@ -218,7 +389,10 @@ def match_results(
     elif other_result["protocol"] == "usenet":
         # Usenet sizes vary wildly based on PAR2 levels,
         # etc, so size comparisons aren't very useful
-        if levenshtein(other_result["title"], ptp_result["title"]) <= title_distance:
+        if (
+            levenshtein(other_result["title"], ptp_result["title"], title_distance)
+            <= title_distance
+        ):
             logger.info(
                 "usenet title match: %s (%s)",
                 other_result["indexer"],
@@ -233,7 +407,9 @@ def match_results(
         # Also check sortTitle if present
         if "sortTitle" in ptp_result and "sortTitle" in other_result:
             if (
-                levenshtein(other_result["sortTitle"], ptp_result["sortTitle"])
+                levenshtein(
+                    other_result["sortTitle"], ptp_result["sortTitle"], title_distance
+                )
                 <= title_distance
             ):
                 logger.info(
@@ -259,23 +435,22 @@ def bytes_to_human(b: float):
     return "%3.1f TiB" % b
 
 
-def find_match(args, torrent):
+def find_match(args, torrent, prowlarr: Optional[ProwlarrSearch] = None):
     logger = logging.getLogger("reseed-machine.find")
-    session = requests.Session()
-    session.headers.update({"X-Api-Key": config.get("Prowlarr", "api_key")})
+    if prowlarr is None:
+        prowlarr = ProwlarrSearch()
     result = {}
-    imdb_resp = []  # Might be cached for later usage
+    imdb_resp = SearchResults([])  # Might be cached for later usage
     download = {}
     if "imdb" in args.query_type and torrent["Movie"]["ImdbId"]:
-        imdb_resp = session.get(
-            urljoin(config.get("Prowlarr", "url"), "api/v1/search"),
-            params={
+        imdb_resp = prowlarr.search(
+            {
                 "query": "{ImdbId:" + torrent["Movie"]["ImdbId"] + "}",
                 "categories": "2000",
                 "type": "movie",
-            },
-        ).json()
-        for r in imdb_resp:
+            }
+        )
+        for r in imdb_resp.results:
             if r[
                 "indexer"
             ] == args.target_tracker and f"torrentid={torrent['Id']}" in r.get(
@@ -326,10 +501,7 @@ def find_match(args, torrent):
 
     # We already have this result from before, and it'll be empty if
     # the imdb query is disabled
-    for other_result in imdb_resp:
-        download = match_results(result, other_result, args.target_tracker)
-        if download:
-            break
+    download = first_match(result, imdb_resp, args.target_tracker)
     if not download:
         for q_type in args.query_type:
             if q_type == "imdb":
@@ -339,17 +511,12 @@ def find_match(args, torrent):
             params = queries[q_type](result)
             params.setdefault("type", "search")
             params.setdefault("limit", "100")
-            release_title_resp = session.get(
-                urljoin(config.get("Prowlarr", "url"), "api/v1/search"),
-                params=params,
-            ).json()
-            for release_result in release_title_resp:
-                if release_result["indexer"] not in ignore_title_indexers:
-                    download = match_results(
-                        result, release_result, args.target_tracker
-                    )
-                    if download:
-                        break
+            download = first_match(
+                result,
+                prowlarr.search(params),
+                args.target_tracker,
+                ignore_title_indexers,
+            )
     if download:
         logger.info(
             "Downloading %s (%s) from %s",
@@ -357,7 +524,7 @@ def find_match(args, torrent):
             download["infoUrl"],
             download["indexer"],
         )
-        r = session.post(
+        r = prowlarr.session.post(
             urljoin(config.get("Prowlarr", "url"), "api/v1/search"),
             json={
                 "guid": download["guid"],
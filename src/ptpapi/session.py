@@ -1,4 +1,5 @@
 import logging
+import threading
 
 from time import sleep, time
 
@@ -24,17 +25,19 @@ class TokenSession(requests.Session):
         self.consumed_tokens = 0
         self.fill_rate = float(fill_rate)
         self.timestamp = time()
+        # The bucket is shared by every thread making requests
+        self._lock = threading.Lock()
 
     def consume(self, tokens):
         """Consume tokens from the bucket. Returns True if there were
         sufficient tokens otherwise False."""
-        self.get_tokens()
-        if tokens <= self.tokens:
-            self._tokens -= tokens
-            self.consumed_tokens += tokens
-            LOGGER.debug("Consuming %i token(s)." % tokens)
-        else:
-            return False
+        with self._lock:
+            if tokens <= self.get_tokens():
+                self._tokens -= tokens
+                self.consumed_tokens += tokens
+                LOGGER.debug("Consuming %i token(s)." % tokens)
+            else:
+                return False
         return True
 
     def request(self, *args, **kwargs):
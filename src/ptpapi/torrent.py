@@ -1,6 +1,7 @@
 """Represent a single torrent object"""
 import html
 import logging
+import os.path
 import re
 
 from pathlib import Path
@@ -13,8 +14,13 @@ from bs4 import BeautifulSoup as bs4
 from ptpapi import movie
 from ptpapi.config import config
 from ptpapi.error import PTPAPIException
+from ptpapi.filelist import Filelist
 from ptpapi.session import session
-from ptpapi.util import title_time_to_json_format
+from ptpapi.util import (
+    invert_key_finder,
+    split_file_sections,
+    title_time_to_json_format,
+)
 
 
 LOGGER = logging.getLogger(__name__)
@@ -23,44 +29,51 @@ LOGGER = logging.getLogger(__name__)
 class Torrent:
     """Represent a single torrent"""
 
-    def __init__(self, ID=None, data=None):
-        self.key_finder = {
-            "movie_json": [
-                "Checked",
-                "Codec",
-                "Container",
-                "GoldenPopcorn",
-                "GroupId",
-                "InfoHash",
-                "Leechers",
-                "Quality",
-                "ReleaseGroup",
-                "ReleaseName",
-                "RemasterTitle",
-                "Resolution",
-                "Scene",
-                "Seeders",
-                "Size",
-                "Snatched",
-                "Source",
-                "UploadTime",
-            ],
-            "torrent_json": ["Description", "Nfo"],
-            "movie_html": [
-                "Filelist",
-                "LastActive",
-                "LastReseedRequest",
-                "ReseedWaitingUsers",
-                "Trumpable",
-            ],
-            "inferred": ["Link", "Id", "HumanSize"],
-            "inferred_size": ["HumanSize"],
-            "torrent_description": ["BBCodeDescription"],
-            "parent": [
-                "Movie"  # Would be 'inferred' if it didn't have a chance to trigger a request
-            ],
-        }
+    __slots__ = ("ID", "data", "_file_section")
+
+    key_finder = {
+        "movie_json": [
+            "Checked",
+            "Codec",
+            "Container",
+            "GoldenPopcorn",
+            "GroupId",
+            "InfoHash",
+            "Leechers",
+            "Quality",
+            "ReleaseGroup",
+            "ReleaseName",
+            "RemasterTitle",
+            "Resolution",
+            "Scene",
+            "Seeders",
+            "Size",
+            "Snatched",
+            "Source",
+            "UploadTime",
+        ],
+        "torrent_json": ["Description", "Nfo"],
+        "file_section": ["Filelist"],
+        "movie_html": [
+            "Filelist",
+            "LastActive",
+            "LastReseedRequest",
+            "ReseedWaitingUsers",
+            "Trumpable",
+        ],
+        "inferred": ["Link", "Id", "HumanSize"],
+        "inferred_size": ["HumanSize"],
+        "torrent_description": ["BBCodeDescription"],
+        "parent": [
+            "Movie"  # Would be 'inferred' if it didn't have a chance to trigger a request
+        ],
+    }
+    field_loaders = invert_key_finder(key_finder)
 
+    def __init__(self, ID=None, data=None):
+        # Raw HTML of the file list, if it was cut out of a movie page
+        # but hasn't been parsed yet
+        self._file_section = None
         if data:
             self.data = data
             if "Id" in data:
@@ -86,9 +99,10 @@ class Torrent:
 
     def __getitem__(self, name):
         if name not in self.data or self.data[name] is None:
-            for k, value in self.key_finder.items():
-                if name in value:
-                    getattr(self, "load_%s_data" % k)()
+            for loader in self.field_loaders.get(name, ()):
+                getattr(self, loader)()
+                if self.data.get(name) is not None:
+                    break
         return self.data[name]
 
     def __setitem__(self, key, value):
@@ -116,27 +130,18 @@ class Torrent:
                 "torrents.php", params={"torrentid": self.ID}
             ).url
             self.data["GroupId"] = parse_qs(urlparse(movie_url).query)["id"][0]
-        soup = bs4(
+        page, file_sections = split_file_sections(
             session.base_get(
                 "torrents.php", params={"id": self.data["GroupId"], "json": 0}
-            ).content,
-            "html.parser",
+            ).text
         )
+        soup = bs4(page, "html.parser")
         # Scrape file list
-        filediv = soup.find("div", id="files_%s" % self.ID)
-        self.data["Filelist"] = {}
-        for elem in filediv.find("tbody").find_all("tr"):
-            bytesize = (
-                elem("td")[1]("span")[0]["title"].replace(",", "").replace(" bytes", "")
-            )
-            self.data["Filelist"][elem("td")[0].string] = bytesize
+        section = file_sections[str(self.ID)]
+        self._file_section = None
+        self.data["Filelist"] = parse_file_section(section, self.ID)
         # Check if trumpable
-        if soup.find("trumpable_%s" % self.ID):
-            self.data["Trumpable"] = [
-                s.get_text() for s in soup.find("trumpable_%s" % self.ID).find("span")
-            ]
-        else:
-            self.data["Trumpable"] = []
+        self.data["Trumpable"] = parse_trumpable(soup, section, self.ID)
         # Get reseed information
         tor_row = soup.find("tr", id="torrent_%s" % self.ID)
         self.data.update(
@@ -153,6 +158,13 @@ class Torrent:
                     r"(\d+) user", str(elem)
                 ).group(1)
 
+    def load_file_section_data(self):
+        """Parse a file list that was cut out of the movie's HTML page"""
+        section = self._file_section
+        if section is not None:
+            self.data["Filelist"] = parse_file_section(section, self.ID)
+            self._file_section = None
+
     def load_movie_json_data(self):
         """Load data from the movie page"""
         LOGGER.debug("Loading Torrent data from movie JSON page.")
@@ -234,3 +246,48 @@ class Torrent:
         with dest.open("wb") as fileh:
             fileh.write(req.content)
         return dest
+
+
+def parse_file_section(section, torrent_id):
+    """Parse the file list div of a torrent
+
+    :param section: the raw html of the div
+    :param torrent_id: the ID of the torrent the div belongs to
+    :rtype: a Filelist of paths (including the torrent's base directory) to sizes
+    """
+    filediv = bs4(section, "html.parser").find("div", id="files_%s" % torrent_id)
+    files = []
+    basepath = ""
+    base_match = re.match(
+        r"\/(.*)\/", filediv.find("thead").find_all("div")[1].get_text()
+    )
+    if base_match is not None:
+        basepath = base_match.group(1)
+    for elem in filediv.find("tbody").find_all("tr"):
+        try:
+            bytesize = (
+                elem("td")[1]("span")[0]["title"].replace(",", "").replace(" bytes", "")
+            )
+        except IndexError:
+            LOGGER.error(
+                "Could not parse site for filesize, possibly check for bad filenames: https://passthepopcorn.me/torrents.php?torrentid=%s",
+                torrent_id,
+            )
+            continue
+        files.append((os.path.join(basepath, elem("td")[0].string), bytesize))
+    return Filelist(files)
+
+
+def parse_trumpable(soup, section, torrent_id):
+    """Find the trumpable reasons of a torrent, either in the main page
+    or in its file list div
+
+    :param soup: the parsed movie page
+    :param section: the raw html of the torrent's file list div, if any
+    :rtype: a list of reasons"""
+    elem = soup.find(id="trumpable_%s" % torrent_id)
+    if elem is None and section and "trumpable_%s" % torrent_id in section:
+        elem = bs4(section, "html.parser").find(id="trumpable_%s" % torrent_id)
+    if elem is None:
+        return []
+    return [s.get_text() for s in elem.find_all("span")]
@@ -0,0 +1,197 @@
+"""A persistent index of .torrent files, for finding a torrent by its
+info hash or PTP ID without re-reading every file"""
+import logging
+import multiprocessing
+import os
+import os.path
+import re
+import sqlite3
+import threading
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from ptpapi.metainfo import read_metainfo_file
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Only PTP's own permalinks, since other Gazelle-based trackers use the
+# same URLs for their own (unrelated) IDs
+RE_COMMENT = re.compile(
+    r"https://passthepopcorn\.me/torrents\.php\?id=(\d+)&torrentid=(\d+)"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS torrents (
+  path TEXT PRIMARY KEY,
+  mtime REAL,
+  file_size INTEGER,
+  info_hash TEXT,
+  name TEXT,
+  size INTEGER,
+  group_id INTEGER,
+  torrent_id INTEGER,
+  comment TEXT
+);
+CREATE INDEX IF NOT EXISTS torrents_info_hash ON torrents(info_hash);
+CREATE INDEX IF NOT EXISTS torrents_torrent_id ON torrents(torrent_id);
+CREATE INDEX IF NOT EXISTS torrents_group_id ON torrents(group_id);
+"""
+
+COLUMNS = (
+    "path",
+    "mtime",
+    "file_size",
+    "info_hash",
+    "name",
+    "size",
+    "group_id",
+    "torrent_id",
+    "comment",
+)
+
+
+def _find_torrents(root):
+    """All .torrent files under a directory, with their mtimes and sizes"""
+    found = {}
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.endswith(".torrent") and entry.is_file():
+                            stat = entry.stat()
+                            found[entry.path] = (stat.st_mtime, stat.st_size)
+                    except OSError as exc:
+                        LOGGER.warning("Could not read %r: %s", entry.path, exc)
+        except OSError as exc:
+            LOGGER.warning("Could not scan %r: %s", directory, exc)
+    return found
+
+
+def _read_torrent(path):
+    """The indexed fields for a single .torrent file (all None if it
+    couldn't be parsed, so it isn't retried until it changes)"""
+    try:
+        meta = read_metainfo_file(path)
+    except (OSError, ValueError) as exc:
+        LOGGER.warning("Could not parse %r: %s", path, exc)
+        return (None,) * 6
+    match = RE_COMMENT.match(meta["comment"] or "")
+    return (
+        meta["info_hash"],
+        meta["name"],
+        meta["length"],
+        int(match.group(1)) if match else None,
+        int(match.group(2)) if match else None,
+        meta["comment"],
+    )
+
+
+class TorrentIndex:
+    """An SQLite-backed index of the .torrent files under one or more
+    directories"""
+
+    def __init__(self, db_path):
+        self.db_path = os.path.expanduser(db_path)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def update(self, roots, jobs=None):
+        """Bring the index up to date with the filesystem
+
+        Each root is walked in its own thread, and only files whose
+        mtime or size changed since the last update are parsed (spread
+        across several processes when there are many of them).
+
+        :param roots: a list of directories to index
+        :param jobs: the maximum number of threads/processes to use
+        :rtype: the number of .torrent files that were (re-)parsed"""
+        roots = [os.path.abspath(os.path.expanduser(str(r))) for r in roots]
+        if not roots:
+            return 0
+        with ThreadPoolExecutor(max_workers=jobs or len(roots)) as pool:
+            found = {}
+            for files in pool.map(_find_torrents, roots):
+                found.update(files)
+        known = {}
+        for root in roots:
+            for path, mtime, file_size in self._query(
+                "SELECT path, mtime, file_size FROM torrents"
+                " WHERE path >= ? AND path < ?",
+                (root + os.sep, root + chr(ord(os.sep) + 1)),
+            ):
+                known[path] = (mtime, file_size)
+        changed = [path for path, stat in found.items() if known.get(path) != stat]
+        removed = [path for path in known if path not in found]
+        if len(changed) > 256 and jobs != 1:
+            # Not forked, as other threads may be holding locks
+            with ProcessPoolExecutor(
+                max_workers=jobs, mp_context=multiprocessing.get_context("forkserver")
+            ) as pool:
+                parsed = list(pool.map(_read_torrent, changed, chunksize=64))
+        else:
+            parsed = [_read_torrent(path) for path in changed]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "DELETE FROM torrents WHERE path = ?", [(p,) for p in removed]
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO torrents ({0}) VALUES ({1})".format(
+                    ", ".join(COLUMNS), ", ".join("?" * len(COLUMNS))
+                ),
+                [
+                    (path,) + found[path] + fields
+                    for path, fields in zip(changed, parsed)
+                ],
+            )
+        LOGGER.info(
+            "Indexed %i changed .torrent files, removed %i", len(changed), len(removed)
+        )
+        return len(changed)
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _rows(self, where, params):
+        return [
+            dict(zip(COLUMNS, row))
+            for row in self._query(
+                "SELECT {0} FROM torrents WHERE {1} ORDER BY path".format(
+                    ", ".join(COLUMNS), where
+                ),
+                params,
+            )
+        ]
+
+    def by_info_hash(self, info_hash):
+        """All indexed .torrent files with the given info hash
+
+        :rtype: a list of dictionaries of the indexed fields"""
+        return self._rows("info_hash = ?", (info_hash.upper(),))
+
+    def by_torrent_id(self, torrent_id):
+        """All indexed .torrent files for a PTP torrent ID"""
+        return self._rows("torrent_id = ?", (int(torrent_id),))
+
+    def by_group_id(self, group_id):
+        """All indexed .torrent files for a PTP movie (group) ID"""
+        return self._rows("group_id = ?", (int(group_id),))
+
+    def ptp_torrents(self, under):
+        """All indexed .torrent files under a directory with a PTP
+        permalink in their comment"""
+        under = os.path.abspath(os.path.expanduser(str(under)))
+        return self._rows(
+            "torrent_id IS NOT NULL AND path >= ? AND path < ?",
+            (under + os.sep, under + chr(ord(os.sep) + 1)),
+        )
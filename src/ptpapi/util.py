@@ -20,6 +20,18 @@ def raise_for_cloudflare(text):
         raise PTPAPIException("Encountered Cloudflare error page: ", msg)
 
 
+def invert_key_finder(key_finder):
+    """Map each field in a key_finder to the loader method(s) that fill it in
+
+    :param key_finder: a dictionary of loader names to lists of fields
+    :rtype: a dictionary of fields to tuples of method names"""
+    loaders = {}
+    for key, fields in key_finder.items():
+        for field in fields:
+            loaders.setdefault(field, []).append("load_%s_data" % key)
+    return {field: tuple(names) for field, names in loaders.items()}
+
+
 def sizeof_fmt(num, suffix="B"):
     for unit in ["", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi"]:
         if abs(num) < 1024.0:
@@ -165,6 +177,37 @@ def find_page_range(text) -> int:
     return int(qs["page"][0])
 
 
+RE_FILES_DIV = re.compile(r'<div\b[^>]*\bid="files_(\d+)"[^>]*>')
+RE_DIV_TAG = re.compile(r"<(/?)div\b", flags=re.IGNORECASE)
+
+
+def split_file_sections(text):
+    """Cut the per-torrent file list divs out of a movie's HTML page,
+    so that the rest of the page can be parsed without them.
+
+    :param text: a raw html string
+    :rtype: a tuple of the remaining html, and a dictionary of torrent
+        IDs (as strings) to the raw html of their file list div"""
+    sections = {}
+    remaining = []
+    last = 0
+    for match in RE_FILES_DIV.finditer(text):
+        if match.start() < last:
+            continue
+        depth = 1
+        end = len(text)
+        for tag in RE_DIV_TAG.finditer(text, match.end()):
+            depth += -1 if tag.group(1) else 1
+            if depth == 0:
+                end = text.find(">", tag.end()) + 1 or len(text)
+                break
+        sections[match.group(1)] = text[match.start() : end]
+        remaining.append(text[last : match.start()])
+        last = end
+    remaining.append(text[last:])
+    return "".join(remaining), sections
+
+
 def title_time_to_json_format(timestr: str) -> str:
     """Massage to match JSON output"""
     return datetime.datetime.strptime(timestr, "%b %d %Y, %H:%M").strftime(
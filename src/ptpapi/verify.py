@@ -0,0 +1,241 @@
+"""Check torrent piece hashes against local data, spread across several
+processes"""
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import os.path
+import random
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+LOGGER = logging.getLogger(__name__)
+
+# How much data each task hashes, large enough that the per-task
+# overhead doesn't matter, and small enough to stop soon after a failure
+CHUNK_SIZE = 64 * 1024 * 1024
+READ_SIZE = 4 * 1024 * 1024
+
+
+def torrent_files(info, datapath):
+    """The local paths and lengths of every file in a torrent, in order
+
+    :param info: the torrent's info dictionary
+    :param datapath: the torrent's data, i.e. the file itself for single
+        file torrents, or the torrent's top directory otherwise
+    :rtype: a list of (path, length) tuples"""
+    datapath = str(datapath)
+    if "files" in info:
+        return [
+            (os.path.join(datapath, *f["path"]), int(f["length"]))
+            for f in info["files"]
+        ]
+    if os.path.isdir(datapath):
+        datapath = os.path.join(datapath, info["name"])
+    return [(datapath, int(info["length"]))]
+
+
+def _hashes(info):
+    """The concatenated piece hashes, as bytes (some bencode decoders
+    return them as a string when they happen to be valid UTF-8)"""
+    pieces = info["pieces"]
+    if isinstance(pieces, str):
+        pieces = pieces.encode("utf-8", errors="surrogateescape")
+    return pieces
+
+
+def _segments(files, offsets, start, end):
+    """The (path, offset in file, length) pieces of the files covering the
+    byte range [start, end)"""
+    segments = []
+    index = bisect.bisect_right(offsets, start) - 1
+    while start < end and index < len(files):
+        path, length = files[index]
+        file_start = start - offsets[index]
+        size = min(length - file_start, end - start)
+        if size > 0:
+            segments.append((path, file_start, size))
+            start += size
+        index += 1
+    return segments
+
+
+def check_pieces(segments, piece_length, first_piece, hashes):
+    """Hash a run of consecutive pieces
+
+    :param segments: the (path, offset, length) file ranges making up the pieces
+    :param piece_length: the torrent's piece length
+    :param first_piece: the index of the first piece in the run
+    :param hashes: the expected SHA1 digests of the pieces, concatenated
+    :rtype: None if everything matches, otherwise the index of the first
+        bad piece and the path it (at least partially) came from"""
+    buf = bytearray(min(piece_length, READ_SIZE))
+    view = memoryview(buf)
+    digest = hashlib.sha1()
+    filled = 0
+    piece = 0
+    for path, offset, length in segments:
+        with open(path, "rb") as fh:
+            fh.seek(offset)
+            while length > 0:
+                want = min(piece_length - filled, length, len(buf))
+                got = fh.readinto(view[:want])
+                if not got:
+                    raise OSError("Unexpected end of file %r" % path)
+                digest.update(view[:got])
+                filled += got
+                length -= got
+                if filled == piece_length:
+                    if digest.digest() != hashes[piece * 20 : piece * 20 + 20]:
+                        return first_piece + piece, path
+                    digest = hashlib.sha1()
+                    filled = 0
+                    piece += 1
+    # The very last piece of a torrent is usually shorter
+    if filled and digest.digest() != hashes[piece * 20 : piece * 20 + 20]:
+        return first_piece + piece, path
+    return None
+
+
+def _layout(info, datapath):
+    """Check the file sizes, and work out where each file starts
+
+    :rtype: a tuple of the files, their starting offsets, and the total size"""
+    files = torrent_files(info, datapath)
+    for path, length in files:
+        if os.path.getsize(path) != length:
+            raise OSError(
+                "File size mismatch for %r [is %d, expected %d]"
+                % (path, os.path.getsize(path), length)
+            )
+    offsets = [0]
+    for _, length in files:
+        offsets.append(offsets[-1] + length)
+    total = offsets.pop()
+    if len(_hashes(info)) != 20 * (
+        (total + int(info["piece length"]) - 1) // int(info["piece length"])
+    ):
+        raise OSError("Piece count does not match the size of the data")
+    return files, offsets, total
+
+
+def sample_pieces(info, count):
+    """Pick which pieces to check for a quick verification: the first
+    and last pieces, pieces that span the boundary between two files
+    (where misaligned data shows up), and then random pieces
+
+    :param info: the torrent's info dictionary
+    :param count: roughly how many pieces to pick
+    :rtype: a sorted list of piece indexes"""
+    piece_length = int(info["piece length"])
+    piece_count = len(_hashes(info)) // 20
+    if not piece_count:
+        return []
+    chosen = {0, piece_count - 1}
+    boundaries = []
+    offset = 0
+    for f in info.get("files", [])[:-1]:
+        offset += int(f["length"])
+        if offset % piece_length:
+            boundaries.append(offset // piece_length)
+    boundaries = sorted(set(boundaries) - chosen)
+    room = max(count - len(chosen), 0)
+    if len(boundaries) > room // 2:
+        # Spread the boundary checks out, leaving half for random pieces
+        step = len(boundaries) / max(room // 2, 1)
+        boundaries = [boundaries[int(i * step)] for i in range(room // 2)]
+    chosen.update(boundaries)
+    rest = [i for i in range(piece_count) if i not in chosen]
+    chosen.update(random.sample(rest, min(len(rest), max(count - len(chosen), 0))))
+    return sorted(chosen)
+
+
+def quick_check(info, datapath, count=16):
+    """Check a small sample of a torrent's pieces (see sample_pieces()),
+    to reject bad matches quickly before any full check
+
+    Raises an OSError on the first bad piece, like hash_check().
+
+    :param info: the torrent's info dictionary
+    :param datapath: the torrent's data (see torrent_files())
+    :param count: roughly how many pieces to check
+    :rtype: the number of pieces checked"""
+    files, offsets, total = _layout(info, datapath)
+    piece_length = int(info["piece length"])
+    hashes = _hashes(info)
+    pieces = sample_pieces(info, count)
+    for piece in pieces:
+        start = piece * piece_length
+        failure = check_pieces(
+            _segments(files, offsets, start, min(total, start + piece_length)),
+            piece_length,
+            piece,
+            hashes[piece * 20 : piece * 20 + 20],
+        )
+        if failure is not None:
+            raise OSError(
+                f"Piece #{failure[0]}: Hashes differ in file {str(failure[1])!r}"
+            )
+    return len(pieces)
+
+
+def hash_check(info, datapath, jobs=None):
+    """Check all of a torrent's pieces, using several processes at once
+
+    Stops as soon as a bad piece is found, in which case an OSError is
+    raised, the same as pyrosimple's PieceFailer.
+
+    :param info: the torrent's info dictionary
+    :param datapath: the torrent's data (see torrent_files())
+    :param jobs: the number of processes to use, defaults to the number of CPUs"""
+    files, offsets, total = _layout(info, datapath)
+    piece_length = int(info["piece length"])
+    pieces = _hashes(info)
+    chunk_pieces = max(1, CHUNK_SIZE // piece_length)
+    tasks = []
+    for first in range(0, len(pieces) // 20, chunk_pieces):
+        start = first * piece_length
+        end = min(total, (first + chunk_pieces) * piece_length)
+        tasks.append(
+            (
+                _segments(files, offsets, start, end),
+                piece_length,
+                first,
+                pieces[first * 20 : (first + chunk_pieces) * 20],
+            )
+        )
+    jobs = jobs or os.cpu_count() or 1
+    LOGGER.debug(
+        "Checking %i pieces in %i chunks with %i processes",
+        len(pieces) // 20,
+        len(tasks),
+        jobs,
+    )
+    failure = None
+    if jobs == 1 or len(tasks) <= 1:
+        for task in tasks:
+            failure = check_pieces(*task)
+            if failure is not None:
+                break
+    else:
+        # Forking copies whatever locks other threads (e.g. --jobs
+        # workers) hold at that moment, so start from a clean process
+        with ProcessPoolExecutor(
+            max_workers=min(jobs, len(tasks)),
+            mp_context=multiprocessing.get_context("forkserver"),
+        ) as pool:
+            futures = [pool.submit(check_pieces, *task) for task in tasks]
+            try:
+                for future in as_completed(futures):
+                    failure = future.result()
+                    if failure is not None:
+                        break
+            finally:
+                # Anything not yet started is dropped, so this only waits
+                # for the chunks already in progress
+                for pending in futures:
+                    pending.cancel()
+    if failure is not None:
+        raise OSError(f"Piece #{failure[0]}: Hashes differ in file {str(failure[1])!r}")
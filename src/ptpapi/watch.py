@@ -0,0 +1,149 @@
+"""Watch directories for new files and directories with inotify, and
+report each one once it has stopped changing"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import os.path
+import select
+import struct
+
+from time import monotonic
+
+
+LOGGER = logging.getLogger(__name__)
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+EVENT = struct.Struct("iIII")
+
+
+def _libc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError(errno.ENOSYS, "inotify is not available on this system")
+    return libc
+
+
+class DirectoryWatcher:
+    """Watches one or more directories (recursively) for new entries
+
+    Only the entries directly inside each directory are reported, since
+    those are what get reseeded: a new file or directory is reported
+    once nothing inside it has changed for `quiet_period` seconds, so
+    that downloads and copies in progress aren't picked up half done."""
+
+    def __init__(self, roots, quiet_period=60):
+        self.roots = [os.path.abspath(os.path.expanduser(str(r))) for r in roots]
+        self.quiet_period = quiet_period
+        self.libc = _libc()
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.watches = {}
+        # Each top level entry that has changed, and when it last did
+        self.pending = {}
+        for root in self.roots:
+            self._watch_tree(root)
+
+    def close(self):
+        os.close(self.fd)
+
+    def _watch_tree(self, directory):
+        for dirpath, _, _ in os.walk(directory):
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(dirpath), WATCH_MASK | IN_ONLYDIR
+            )
+            if wd < 0:
+                err = ctypes.get_errno()
+                LOGGER.warning("Could not watch %r: %s", dirpath, os.strerror(err))
+                if err == errno.ENOSPC:
+                    LOGGER.warning(
+                        "Raise fs.inotify.max_user_watches to watch more directories"
+                    )
+                continue
+            self.watches[wd] = dirpath
+
+    def _entry(self, path):
+        """The top level entry a path belongs to, or None for the roots
+        themselves"""
+        for root in self.roots:
+            if path.startswith(root + os.sep):
+                return os.path.join(root, path[len(root) + 1 :].split(os.sep, 1)[0])
+        return None
+
+    def _read(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        now = monotonic()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size : offset + EVENT.size + length]
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                LOGGER.warning(
+                    "Too many filesystem events at once, some new files may have been missed"
+                )
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches:
+                continue
+            path = self.watches[wd]
+            if name.rstrip(b"\0"):
+                path = os.path.join(path, os.fsdecode(name.rstrip(b"\0")))
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(path)
+            entry = self._entry(path)
+            if entry is None:
+                continue
+            if mask & (IN_DELETE | IN_MOVED_FROM) and entry == path:
+                # Renamed or removed before it settled, e.g. a client
+                # dropping a '.part' suffix once a download completes
+                self.pending.pop(entry, None)
+            else:
+                self.pending[entry] = now
+
+    def settled(self):
+        """Wait for new entries, forever
+
+        :rtype: a generator of sorted lists of paths"""
+        while True:
+            now = monotonic()
+            ready = [
+                path
+                for path, changed in self.pending.items()
+                if now - changed >= self.quiet_period
+            ]
+            for path in ready:
+                del self.pending[path]
+            ready = [path for path in ready if os.path.exists(path)]
+            if ready:
+                yield sorted(ready)
+                continue
+            timeout = None
+            if self.pending:
+                timeout = max(
+                    min(self.pending.values()) + self.quiet_period - now, 0.01
+                )
+            select.select([self.fd], [], [], timeout)
+            self._read()